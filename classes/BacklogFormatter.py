@@ -0,0 +1,86 @@
+import json
+from typing import Callable
+
+from classes.OrderFormatter import OrderFormatter
+from classes.ParserDb import ParserDb
+
+
+class BacklogFormatter:
+    def __init__(self, db_name: str,
+                 get_specs: Callable[[], dict],
+                 get_sources: Callable[[tuple], tuple],
+                 formatter_version: int,
+                 compress_blobs: bool = False,
+                 lot_order_types: tuple = ()):
+        self._db_name = db_name
+        self._get_specs = get_specs
+        self._get_sources = get_sources
+        self._formatter_version = formatter_version
+        self._compress_blobs = compress_blobs
+        self._lot_order_types = lot_order_types
+        self.__formatter = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_BacklogFormatter__formatter"] = None
+        return state
+
+    def format_range(self, rowid_range: tuple) -> list:
+        first_rowid, last_rowid = rowid_range
+        with ParserDb(self._db_name, compress_blobs=self._compress_blobs) as db:
+            results, pending_orders = [], []
+            for order in db.iter_unsent_payloads(first_rowid=first_rowid, last_rowid=last_rowid):
+                if order.get("payload") and order.get("payload_version") == self._formatter_version:
+                    results.append(self.__get_result(order, json.loads(order.get("payload"))))
+                else:
+                    pending_orders.append(order)
+
+            order_blobs = db.get_order_blobs([(order.get("order_type"), order.get("order_id"))
+                                              for order in pending_orders])
+            for order in pending_orders:
+                order.update(order_blobs.get((order.get("order_type"), str(order.get("order_id"))), {}))
+            customer_ids = [order.get("customer_id") for order in pending_orders]
+            customers = {customer_id: json.loads(customer.get("customer_data"))
+                         for customer_id, customer in db.get_customers_by_customer_ids(customer_ids).items()}
+
+            rows = []
+            for order in pending_orders:
+                customer = customers.get(str(order.get("customer_id")))
+                if customer is None or (order.get("order_type") in self._lot_order_types
+                                        and not order.get("order_lots")):
+                    # the parser reports the missing customer and fetches missing lots itself
+                    results.append(order)
+                else:
+                    rows.append((order, customer))
+
+            failed_keys = set()
+            formatted_orders = self.__get_formatter().format_many(
+                rows, lambda row, err: failed_keys.add((row[0].get("order_type"), row[0].get("order_id"))))
+            payloads = []
+            for (order, customer), formatted_order in zip(rows, formatted_orders):
+                if (order.get("order_type"), order.get("order_id")) in failed_keys:
+                    # the parser formats the order again and reports the error
+                    results.append(order)
+                    continue
+                results.append(self.__get_result(order, formatted_order))
+                if formatted_order:
+                    payloads.append((json.dumps(formatted_order, ensure_ascii=False), self._formatter_version,
+                                     order.get("order_type"), order.get("order_id")))
+            if payloads:
+                db.update_order_payloads(payloads)
+        return results
+
+    def __get_formatter(self) -> OrderFormatter:
+        if self.__formatter is None:
+            self.__formatter = OrderFormatter(self._get_specs(), self._get_sources)
+        return self.__formatter
+
+    @staticmethod
+    def __get_result(order: dict, formatted_order: dict) -> dict:
+        return {
+            "url": order.get("url"),
+            "order_type": order.get("order_type"),
+            "order_id": order.get("order_id"),
+            "customer_id": order.get("customer_id"),
+            "formatted_order": formatted_order
+        }
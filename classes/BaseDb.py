@@ -1,30 +1,93 @@
 import sqlite3
+import threading
 
 
 class BaseDb:
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str,
+                 cache_size_kb: int = 64 * 1024,
+                 mmap_size: int = 256 * 1024 * 1024):
         self._db_name = db_name
+        self._cache_size_kb = cache_size_kb
+        self._mmap_size = mmap_size
+        self.__connection = None
+        self.__lock = threading.RLock()
 
-    def create_connection(self) -> sqlite3.Connection:
-        connection = sqlite3.connect(self._db_name)
-        return connection
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def execute(self, query, params: tuple = ()) -> bool:
+        with self.__lock:
+            connection = self.get_connection()
+            with connection:
+                connection.execute(query, params)
+        return True
+
+    def execute_transaction(self, queries: list) -> bool:
+        with self.__lock:
+            connection = self.get_connection()
+            connection.execute("BEGIN")
+            try:
+                for query, params in queries:
+                    connection.execute(query, params)
+            except sqlite3.Error:
+                connection.rollback()
+                raise
+            connection.commit()
+        return True
+
+    def get_all_from_db(self, query, params: tuple = ()) -> list:
+        with self.__lock:
+            return self.get_connection().execute(query, params).fetchall()
 
-    def get_all_from_db(self, query) -> list:
-        connection = self.create_connection()
-        result = [row for row in connection.execute(query)]
-        return result
+    def get_connection(self) -> sqlite3.Connection:
+        with self.__lock:
+            if self.__connection is None:
+                self.__connection = self.__connect()
+            return self.__connection
 
     def get_db_name(self):
         return self._db_name
 
-    def write_data_to_db(self, query, data) -> bool:
-        connection = self.create_connection()
+    def iter_from_db(self, query, params: tuple = (), batch_size: int = 500):
+        # a separate connection reads a stable snapshot while the shared one keeps writing
+        connection = self.__connect()
         try:
-            with connection:
-                connection.executemany(query, data)
-        except sqlite3.IntegrityError as err:
-            # print('Возникла ошибка: ', err)
-            return False
-        else:
-            # print('Запись данных прошла успешно')
-            return True
+            cursor = connection.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            connection.close()
+
+    def write_data_to_db(self, query, data) -> bool:
+        with self.__lock:
+            connection = self.get_connection()
+            try:
+                with connection:
+                    connection.executemany(query, data)
+            except sqlite3.IntegrityError as err:
+                # print('Возникла ошибка: ', err)
+                return False
+            else:
+                # print('Запись данных прошла успешно')
+                return True
+
+    def __connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._db_name, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA cache_size=-{int(self._cache_size_kb)}")
+        connection.execute(f"PRAGMA mmap_size={int(self._mmap_size)}")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        return connection
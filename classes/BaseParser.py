@@ -1,30 +1,77 @@
 import json
 import os
-import random
 import sys
 import logging
 from time import sleep
 
+import requests
+
+from classes.BaseSender import BaseSender
+from classes.JsonStream import JsonStream
+from classes.NullSender import NullSender
+from classes.PoolAdapter import PoolAdapter
+from classes.RateLimiter import RateLimiter
+from classes.ReportSender import ReportSender
+from classes.ResponseCache import ResponseCache
+from classes.RetryPolicy import RetryPolicy
+
 
 class BaseParser:
     def __init__(self, parser_name: str,
                  is_logging: bool = True,
                  is_sleeping: bool = True,
                  is_sending_orders: bool = True,
-                 append_base_path: bool = True):
+                 append_base_path: bool = True,
+                 pool_sizes: dict = None,
+                 pool_timeout: float = 60,
+                 timeout: tuple = (5, 30),
+                 rate_limits: dict = None,
+                 retry_policy: RetryPolicy = None,
+                 response_cache: ResponseCache = None,
+                 sender: BaseSender = None,
+                 report_path: str = "/home/manage_report"):
         self._parser_name = parser_name
         self._is_logging = is_logging
         self._is_sleeping = is_sleeping
         self._is_sending_orders = is_sending_orders
         self._append_base_path = append_base_path
+        self._timeout = timeout
         self.__headers: dict
         self.__logger: logging.Logger
+        self.__session: requests.Session
+        self.__rate_limiter: RateLimiter
+        self.__retry_policy: RetryPolicy
+        self.__response_cache: ResponseCache
+        self.__sender: BaseSender
 
         if self._append_base_path:
             current_dir = os.path.dirname(os.path.realpath(__file__))
             base_path = os.path.dirname(current_dir)
             sys.path.append(base_path)
 
+        if pool_sizes is None:
+            pool_sizes = {
+                "https://zakupki.mos.ru/": 16,
+                "https://old.zakupki.mos.ru/": 4
+            }
+        self._set_session(pool_sizes, pool_timeout)
+
+        if rate_limits is None:
+            rate_limits = {
+                "zakupki.mos.ru": (5, 10),
+                "old.zakupki.mos.ru": (2, 4)
+            }
+        self._set_rate_limiter(RateLimiter(rate_limits))
+        self._set_retry_policy(retry_policy if retry_policy else RetryPolicy())
+        self._set_response_cache(response_cache)
+
+        if sender is None:
+            if self._is_sending_orders and os.path.exists(report_path):
+                sender = ReportSender(report_path)
+            else:
+                sender = NullSender()
+        self._set_sender(sender)
+
         headers = {
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
             "User-agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:104.0) Gecko/20100101 Firefox/104.0"
@@ -43,58 +90,156 @@ class BaseParser:
         if self._is_logging:
             self._get_logger().info(content)
 
-    @staticmethod
-    def read_json_file(filename: str):
-        with open(filename, "r") as file:
-            return json.load(file)
-
-    @staticmethod
-    def write_json_file(filename: str, data):
-        with open(filename, "w") as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
-
     def _get_headers(self) -> dict:
         return self.__headers
 
+    def _get_json(self, url: str, error_message: str = "Ошибка при отправке запроса", stream_key: str = None,
+                  is_revalidating: bool = False) -> dict:
+        response_cache = self._get_response_cache()
+        cached_response = response_cache.get(url) if response_cache else {}
+        if cached_response and not is_revalidating and response_cache.is_fresh(cached_response):
+            return json.loads(cached_response.get("body"))
+        headers = response_cache.get_revalidation_headers(cached_response) if cached_response else {}
+
+        retry_policy = self._get_retry_policy()
+        attempt = 0
+        while True:
+            attempt += 1
+            if self._is_sleeping:
+                self._get_rate_limiter().wait(url)
+
+            try:
+                response = self._get_session().get(
+                    url=url,
+                    headers=headers,
+                    timeout=self._timeout,
+                    stream=stream_key is not None
+                )
+                # a streamed body that is not read keeps its connection out of the pool until closed
+                try:
+                    self._get_rate_limiter().on_response(url, response.status_code,
+                                                         response.headers.get("Retry-After"))
+                    if response.status_code == 304 and cached_response:
+                        response_cache.touch(url)
+                        return json.loads(cached_response.get("body"))
+
+                    if stream_key is not None and not response.ok:
+                        # error bodies are small, read them so they can still be logged
+                        response.content
+                    response.raise_for_status()
+                    if stream_key is not None:
+                        return self.__read_json_stream(response, stream_key)
+
+                    data = response.json()
+                    # the API reports some errors (e.g. 404) in a 200 response body, those are not cached
+                    is_error_body = isinstance(data, dict) and (data.get("httpStatusCode") or 200) >= 400
+                    if response_cache and not is_error_body:
+                        response_cache.put(url, response.content, response.headers)
+                    return data
+                finally:
+                    response.close()
+            except requests.exceptions.RequestException as err:
+                if retry_policy.should_retry(err, attempt):
+                    sleep(retry_policy.get_delay(attempt))
+                    continue
+
+                self.add_logger_error(f"{error_message}: {url} (попытка {attempt})")
+                self.add_logger_error(err)
+                if err.response is not None:
+                    self.add_logger_error(err.response.content[:500])
+                return {}
+
     def _get_logger(self) -> logging.Logger:
         return self.__logger
 
     def _get_parser_name(self):
         return self._parser_name
 
-    def _send_to_api(self, data: dict):
-        path = "/home/manage_report"
-        if os.path.exists(path) and self._is_sending_orders:
-            sys.path.append(path)
-            from Send_report.Utils import send_to_api
+    def _get_rate_limiter(self) -> RateLimiter:
+        return self.__rate_limiter
 
-            send_to_api(data)
+    def _get_response_cache(self) -> ResponseCache:
+        return self.__response_cache
 
-    def _send_orders(self, orders: list, is_logging: bool = False) -> bool:
+    def _get_retry_policy(self) -> RetryPolicy:
+        return self.__retry_policy
+
+    def _get_sender(self) -> BaseSender:
+        return self.__sender
+
+    def _get_session(self) -> requests.Session:
+        return self.__session
+
+    def _send_to_api(self, data: dict):
+        return self.__sender.send(data)
+
+    def _send_order_batch(self, orders: list, is_logging: bool = False) -> list:
         data = {
             'name': self._get_parser_name(),
             'data': orders
         }
         try:
-            self._send_to_api(data)
-            if is_logging:
-                self.add_logger_info(f"Успешно отправлено {len(orders)} заказов по API")
-                print(f"Успешно отправлено {len(orders)} заказов по API")
-            return True
+            response = self._send_to_api(data)
         except Exception as err:
             if is_logging:
                 self.add_logger_error("Ошибка при отправке заказа по API")
                 self.add_logger_error(err)
                 print(f"Ошибка при отправке заказа по API")
-            return False
+            return [False] * len(orders)
+
+        if isinstance(response, (list, tuple)) and len(response) == len(orders):
+            results = [result.get("success", False) if isinstance(result, dict) else bool(result)
+                       for result in response]
+        else:
+            results = [True] * len(orders)
+        if is_logging:
+            self.add_logger_info(f"Успешно отправлено {sum(results)} заказов по API")
+            print(f"Успешно отправлено {sum(results)} заказов по API")
+        return results
+
+    def _send_orders(self, orders: list, is_logging: bool = False) -> bool:
+        return all(self._send_order_batch(orders, is_logging))
 
     def _set_headers(self, new_headers: dict):
         self.__headers = new_headers
+        self.__session.headers.update(new_headers)
 
     def _set_logger(self, log_filename: str, log_format: str):
         logging.basicConfig(filename=log_filename, level=logging.INFO, format=log_format)
         self.__logger = logging.getLogger(__name__)
 
-    def _to_sleep(self, start: int = 2, stop: int = 4):
-        if self._is_sleeping:
-            sleep(random.randrange(start, stop))
+    def _set_rate_limiter(self, rate_limiter: RateLimiter):
+        self.__rate_limiter = rate_limiter
+
+    def _set_response_cache(self, response_cache: ResponseCache):
+        if response_cache:
+            response_cache.create_table_responses()
+        self.__response_cache = response_cache
+
+    def _set_retry_policy(self, retry_policy: RetryPolicy):
+        self.__retry_policy = retry_policy
+
+    def _set_sender(self, sender: BaseSender):
+        self.__sender = sender
+
+    def _set_session(self, pool_sizes: dict, pool_timeout: float = None):
+        self.__session = requests.Session()
+        for prefix, pool_size in pool_sizes.items():
+            adapter = PoolAdapter(pool_timeout, pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            self.__session.mount(prefix, adapter)
+
+    @staticmethod
+    def __read_json_stream(response: requests.Response, stream_key: str) -> dict:
+        stream = JsonStream(response.iter_content(chunk_size=64 * 1024), stream_key)
+        # the consumed body can't be read again, so the errors are raised without the response
+        try:
+            items = list(stream)
+        except json.JSONDecodeError as err:
+            raise requests.exceptions.InvalidJSONError(err)
+        finally:
+            response.close()
+        meta = stream.get_meta()
+        # the API reports some errors in a 200 response body, such a page must not pass for an empty one
+        if not stream.has_array() or (meta.get("httpStatusCode") or 200) >= 400:
+            raise requests.exceptions.InvalidJSONError(f"Ответ без списка {stream_key}: {meta}")
+        return {**meta, stream_key: items}
@@ -0,0 +1,10 @@
+from abc import ABC, abstractmethod
+
+
+class BaseSender(ABC):
+    def close(self):
+        pass
+
+    @abstractmethod
+    def send(self, data: dict):
+        pass
@@ -0,0 +1,47 @@
+import threading
+import time
+from typing import Callable
+
+
+class BatchWriter:
+    def __init__(self, write: Callable[[list], bool],
+                 batch_size: int = 500,
+                 max_delay: float = 5):
+        self._write = write
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self.__rows = []
+        self.__first_row_time = None
+        self.__lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def add(self, row) -> bool:
+        with self.__lock:
+            if not self.__rows:
+                self.__first_row_time = time.monotonic()
+            self.__rows.append(row)
+            if len(self.__rows) >= self._batch_size:
+                return self.flush()
+            return self.flush_if_due()
+
+    def flush(self) -> bool:
+        with self.__lock:
+            if not self.__rows:
+                return True
+            rows, self.__rows = self.__rows, []
+            self.__first_row_time = None
+            return self._write(rows)
+
+    def flush_if_due(self) -> bool:
+        with self.__lock:
+            if self.__rows and time.monotonic() - self.__first_row_time >= self._max_delay:
+                return self.flush()
+            return True
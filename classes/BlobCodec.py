@@ -0,0 +1,72 @@
+import re
+import zlib
+from collections import Counter
+
+
+class BlobCodec:
+    __header = b"zb"
+    __token_pattern = re.compile(r'"(?:[^"\\]|\\.)*"\s*:?|\b(?:null|true|false)\b')
+
+    def __init__(self, level: int = 6):
+        self._level = level
+        self.__dictionaries = {}
+        self.__current_dictionaries = {}
+
+    def add_dictionary(self, dict_id: int, kind: str, data: bytes):
+        self.__dictionaries[dict_id] = data
+        if dict_id > self.__current_dictionaries.get(kind, 0):
+            self.__current_dictionaries[kind] = dict_id
+
+    def can_decode(self, value) -> bool:
+        if isinstance(value, bytes) and value.startswith(self.__header):
+            dict_id = int.from_bytes(value[2:4], "big")
+            return not dict_id or dict_id in self.__dictionaries
+        return True
+
+    def decode(self, value):
+        if isinstance(value, bytes) and value.startswith(self.__header):
+            dict_id = int.from_bytes(value[2:4], "big")
+            if dict_id:
+                decompressor = zlib.decompressobj(zdict=self.__dictionaries[dict_id])
+            else:
+                decompressor = zlib.decompressobj()
+            return (decompressor.decompress(value[4:]) + decompressor.flush()).decode("utf-8")
+        return value
+
+    def encode(self, kind: str, value):
+        if not isinstance(value, str):
+            return value
+
+        dict_id = self.__current_dictionaries.get(kind, 0)
+        if dict_id:
+            compressor = zlib.compressobj(self._level, zdict=self.__dictionaries[dict_id])
+        else:
+            compressor = zlib.compressobj(self._level)
+        data = compressor.compress(value.encode("utf-8")) + compressor.flush()
+        return self.__header + dict_id.to_bytes(2, "big") + data
+
+    def get_dictionary_id(self, kind: str) -> int:
+        return self.__current_dictionaries.get(kind, 0)
+
+    def has_dictionary(self, kind: str) -> bool:
+        return kind in self.__current_dictionaries
+
+    @classmethod
+    def train_dictionary(cls, samples: list, size: int = 32 * 1024) -> bytes:
+        counter = Counter()
+        for sample in samples:
+            counter.update(cls.__token_pattern.findall(sample))
+
+        scored_tokens = sorted(
+            (count * len(token), token.encode("utf-8"))
+            for token, count in counter.items() if count > 1
+        )
+        dictionary, dictionary_size = [], 0
+        for score, token in reversed(scored_tokens):
+            if dictionary_size + len(token) > size:
+                continue
+            dictionary.append(token)
+            dictionary_size += len(token)
+
+        # zlib finds matches at the end of the dictionary with the shortest distances
+        return b"".join(reversed(dictionary))
@@ -0,0 +1,52 @@
+import json
+import threading
+from collections import OrderedDict
+
+
+class CustomerCache:
+    def __init__(self, max_size: int = 10000):
+        self._max_size = max_size
+        self.__customers = OrderedDict()
+        self.__customer_data = {}
+        self.__lock = threading.Lock()
+
+    def add(self, customer: dict):
+        customer_id = str(customer.get("customer_id"))
+        with self.__lock:
+            self.__customers[customer_id] = customer
+            self.__customers.move_to_end(customer_id)
+            self.__customer_data.pop(customer_id, None)
+            while len(self.__customers) > self._max_size:
+                evicted_id, evicted_customer = self.__customers.popitem(last=False)
+                self.__customer_data.pop(evicted_id, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__customers.clear()
+            self.__customer_data.clear()
+
+    def get(self, customer_id) -> dict:
+        customer_id = str(customer_id)
+        with self.__lock:
+            customer = self.__customers.get(customer_id, {})
+            if customer:
+                self.__customers.move_to_end(customer_id)
+            return customer
+
+    def get_data(self, customer_id) -> dict:
+        # the decoded customer_data is kept while the customer is cached, its orders share it read-only
+        customer_id = str(customer_id)
+        customer = self.get(customer_id)
+        if not customer:
+            return None
+        with self.__lock:
+            customer_data = self.__customer_data.get(customer_id)
+        if customer_data is None:
+            customer_data = json.loads(customer.get("customer_data"))
+            with self.__lock:
+                if self.__customers.get(customer_id) is customer:
+                    self.__customer_data[customer_id] = customer_data
+        return customer_data
+
+    def get_max_size(self) -> int:
+        return self._max_size
@@ -0,0 +1,18 @@
+import json
+import threading
+
+from classes.BaseSender import BaseSender
+
+
+class FileSender(BaseSender):
+    def __init__(self, filename: str = "orders.ndjson"):
+        self._filename = filename
+        self.__lock = threading.Lock()
+
+    def send(self, data: dict):
+        lines = [json.dumps({"name": data.get("name"), "order": order}, ensure_ascii=False) + "\n"
+                 for order in data.get("data", [])]
+        with self.__lock:
+            with open(self._filename, "a", encoding="utf-8") as file:
+                file.writelines(lines)
+        return None
@@ -0,0 +1,25 @@
+import requests
+
+from classes.BaseSender import BaseSender
+
+
+class HttpSender(BaseSender):
+    def __init__(self, url: str,
+                 headers: dict = None,
+                 timeout: tuple = (5, 60)):
+        self._url = url
+        self._timeout = timeout
+        self.__session = requests.Session()
+        if headers:
+            self.__session.headers.update(headers)
+
+    def close(self):
+        self.__session.close()
+
+    def send(self, data: dict):
+        response = self.__session.post(self._url, json=data, timeout=self._timeout)
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError:
+            return None
@@ -0,0 +1,100 @@
+import codecs
+import json
+
+
+class JsonStream:
+    __whitespace = " \t\n\r"
+    __number_chars = "0123456789+-.eE"
+
+    def __init__(self, chunks, array_key: str = "items"):
+        self._array_key = array_key
+        self.__chunks = iter(chunks)
+        self.__decoder = json.JSONDecoder()
+        self.__text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.__buffer = ""
+        self.__position = 0
+        self.__is_exhausted = False
+        self.__has_array = False
+        self.__meta = {}
+
+    def __iter__(self):
+        self.__expect("{")
+        is_first_key = True
+        while not self.__is_closed("}", is_first_key):
+            is_first_key = False
+            key = self.__read_value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("Expecting property name", self.__buffer, self.__position)
+            self.__expect(":")
+            if key != self._array_key:
+                self.__meta[key] = self.__read_value()
+                continue
+
+            self.__expect("[")
+            self.__has_array = True
+            is_first_item = True
+            while not self.__is_closed("]", is_first_item):
+                is_first_item = False
+                yield self.__read_value()
+                self.__trim()
+
+    def get_meta(self) -> dict:
+        return self.__meta
+
+    def has_array(self) -> bool:
+        return self.__has_array
+
+    def __expect(self, char: str):
+        if self.__skip() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.__buffer, self.__position)
+        self.__position += 1
+
+    def __is_closed(self, char: str, is_first: bool) -> bool:
+        if self.__skip() == char:
+            self.__position += 1
+            return True
+        if not is_first:
+            self.__expect(",")
+        return False
+
+    def __read_chunk(self) -> bool:
+        if self.__is_exhausted:
+            return False
+        try:
+            chunk = next(self.__chunks)
+        except StopIteration:
+            self.__is_exhausted = True
+            self.__buffer += self.__text_decoder.decode(b"", final=True)
+            return False
+        self.__buffer += self.__text_decoder.decode(chunk)
+        return True
+
+    def __read_value(self):
+        self.__skip()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__position)
+            except json.JSONDecodeError:
+                if not self.__read_chunk():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk, e.g. "1." + "5"
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    not self.__buffer[end:].lstrip(self.__number_chars) and self.__read_chunk():
+                continue
+            self.__position = end
+            return value
+
+    def __skip(self) -> str:
+        while True:
+            while self.__position < len(self.__buffer) and \
+                    self.__buffer[self.__position] in self.__whitespace:
+                self.__position += 1
+            if self.__position < len(self.__buffer):
+                return self.__buffer[self.__position]
+            if not self.__read_chunk():
+                raise json.JSONDecodeError("Unexpected end of data", self.__buffer, self.__position)
+
+    def __trim(self):
+        self.__buffer = self.__buffer[self.__position:]
+        self.__position = 0
@@ -0,0 +1,14 @@
+from typing import Callable
+
+
+class Migration:
+    def __init__(self, version: int, name: str,
+                 queries: list = None,
+                 backfill: Callable = None):
+        self.version = version
+        self.name = name
+        self.queries = queries if queries else []
+        self.backfill = backfill
+
+    def __repr__(self):
+        return f"Migration({self.version}, {self.name!r})"
@@ -0,0 +1,73 @@
+import datetime
+
+from classes.BaseDb import BaseDb
+
+
+class Migrator:
+    def __init__(self, db: BaseDb, migrations: list,
+                 batch_size: int = 1000,
+                 dry_run: bool = False):
+        self._db = db
+        self._migrations = sorted(migrations, key=lambda migration: migration.version)
+        self._batch_size = batch_size
+        self._dry_run = dry_run
+
+    def create_table_schema_version(self):
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT DEFAULT "",
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                is_complete BOOLEAN DEFAULT 0
+            )""")
+
+    def get_applied_versions(self) -> dict:
+        query = "SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'"
+        if not self._db.get_all_from_db(query):
+            return {}
+        rows = self._db.get_all_from_db("SELECT version, is_complete FROM schema_version")
+        return {row[0]: bool(row[1]) for row in rows}
+
+    def get_current_version(self) -> int:
+        complete_versions = [version for version, is_complete in self.get_applied_versions().items() if is_complete]
+        return max(complete_versions, default=0)
+
+    def get_pending_migrations(self) -> list:
+        applied_versions = self.get_applied_versions()
+        return [migration for migration in self._migrations if not applied_versions.get(migration.version)]
+
+    def migrate(self) -> list:
+        pending_migrations = self.get_pending_migrations()
+        if self._dry_run:
+            for migration in pending_migrations:
+                print(f"[MIGRATION] (dry run) {migration.version}: {migration.name}")
+                for query in migration.queries:
+                    print(f"    {' '.join(query.split())}")
+                if migration.backfill:
+                    print(f"    backfill: {migration.backfill.__name__} (batch_size={self._batch_size})")
+            return pending_migrations
+
+        self.create_table_schema_version()
+        applied_versions = self.get_applied_versions()
+        for migration in pending_migrations:
+            time_start = datetime.datetime.now()
+            if migration.version not in applied_versions:
+                queries = [(query, ()) for query in migration.queries]
+                queries.append(("INSERT INTO schema_version(version, name, is_complete) VALUES (?, ?, 0)",
+                                (migration.version, migration.name)))
+                self._db.execute_transaction(queries)
+
+            if migration.backfill:
+                count = 0
+                while True:
+                    processed = migration.backfill(self._db, self._batch_size)
+                    if not processed:
+                        break
+                    count += processed
+                    print(f"[MIGRATION] {migration.version}: {migration.name} - обработано {count} строк")
+
+            self._db.execute("UPDATE schema_version SET is_complete=1 WHERE version=?", (migration.version,))
+            seconds = (datetime.datetime.now() - time_start).total_seconds()
+            print(f"[MIGRATION] Миграция {migration.version} ({migration.name}) применена за {seconds:.1f} с")
+
+        return pending_migrations
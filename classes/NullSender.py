@@ -0,0 +1,6 @@
+from classes.BaseSender import BaseSender
+
+
+class NullSender(BaseSender):
+    def send(self, data: dict):
+        return None
@@ -0,0 +1,197 @@
+import copy
+import itertools
+from typing import Callable
+
+
+class OrderFormatter:
+    def __init__(self, specs: dict, get_sources: Callable[[object], tuple] = None):
+        self._get_sources = get_sources
+        self.__formatters = {order_type: self.__compile(fields) for order_type, fields in specs.items()}
+
+    def format(self, order_type: str, sources: dict) -> dict:
+        formatter = self.__formatters.get(order_type)
+        return formatter(sources) if formatter else {}
+
+    def format_many(self, rows: list, on_error: Callable[[object, Exception], None] = None) -> list:
+        results = []
+        for row in rows:
+            try:
+                results.append(self.format(*self._get_sources(row)))
+            except Exception as err:
+                if on_error is None:
+                    raise
+                on_error(row, err)
+                results.append({})
+        return results
+
+    def has_spec(self, order_type: str) -> bool:
+        return order_type in self.__formatters
+
+    @classmethod
+    def __compile(cls, fields: list) -> Callable[[dict], dict]:
+        tree, optional_fields = {}, []
+        for field in fields:
+            target = cls.__split_path(field.get("target"))
+            if field.get("is_optional"):
+                optional_fields.append((cls.__get_source(field), target))
+                continue
+
+            node = tree
+            for key in target[:-1]:
+                node = node.setdefault(key, {})
+            if "value" in field and not field.get("transform") and not isinstance(field.get("value"), (dict, list)):
+                node[target[-1]] = field.get("value")
+            else:
+                node[target[-1]] = cls.__get_source(field)
+
+        # every parent object the fields read from is resolved once per order: the roots in one map() call,
+        # then each nested parent from its already resolved parent
+        paths = {(): None}
+        for path, key, transform in itertools.chain(cls.__iter_sources(tree), (s for s, t in optional_fields)):
+            paths.update(dict.fromkeys(path[:length] for length in range(len(path) + 1)))
+        paths = sorted(paths, key=len)
+        parents = {path: index for index, path in enumerate(paths)}
+        roots = [path[0] for path in paths if len(path) == 1]
+        steps = [(parents[path[:-1]], path[-1]) for path in paths if len(path) > 1]
+
+        # the required fields form one tree of containers that is copied from templates in a single pass,
+        # constants come with the templates, which also keep the keys in spec order
+        node_paths = {(): 0}
+        node_steps, values_fields, computed_fields = [], [], []
+        root_template = cls.__compile_node(tree, (), parents, node_paths, node_steps, values_fields,
+                                           computed_fields)
+
+        optional_steps = []
+        for (path, key, transform), target in optional_fields:
+            length = len(target) - 1
+            while target[:length] not in node_paths:
+                length -= 1
+            missing_keys, leaf = target[length:-1], target[-1]
+            if len(missing_keys) > 1 or any(isinstance(key, int) for key in target[length:]):
+                set_value, missing_key, leaf = cls.__compile_setter(target[length:]), None, None
+            else:
+                set_value, missing_key = None, missing_keys[0] if missing_keys else None
+            optional_steps.append((parents[path], key, transform, node_paths[target[:length]],
+                                   missing_key, leaf, set_value))
+
+        def format_order(sources: dict) -> dict:
+            values = [sources, *map(sources.get, roots)]
+            for index, key in steps:
+                parent = values[index]
+                values.append(parent[key] if isinstance(key, int) else parent.get(key))
+
+            nodes = [root_template.copy()]
+            for parent_index, key, template in node_steps:
+                node = nodes[parent_index][key] = template.copy()
+                nodes.append(node)
+            for node_index, key, index, name in values_fields:
+                nodes[node_index][key] = values[index].get(name)
+            for node_index, key, index, name, transform in computed_fields:
+                value = values[index] if name is None else values[index].get(name)
+                nodes[node_index][key] = transform(value) if transform else value
+
+            for index, key, transform, node_index, missing_key, leaf, set_value in optional_steps:
+                value = values[index] if key is None else values[index].get(key)
+                if transform:
+                    value = transform(value)
+                if not value:
+                    continue
+                node = nodes[node_index]
+                if set_value:
+                    set_value(node, value)
+                elif missing_key is None:
+                    node[leaf] = value
+                else:
+                    child = node.get(missing_key)
+                    if child is None:
+                        child = node[missing_key] = {}
+                    child[leaf] = value
+            return nodes[0]
+
+        return format_order
+
+    @classmethod
+    def __compile_node(cls, node: dict, path: tuple, parents: dict, node_paths: dict, node_steps: list,
+                       values_fields: list, computed_fields: list):
+        if node and all(isinstance(key, int) for key in node):
+            template = [None] * (max(node) + 1)
+        else:
+            template = dict.fromkeys(node)
+        node_index = node_paths[path]
+        for key, child in node.items():
+            if isinstance(child, dict):
+                node_paths[path + (key,)] = len(node_paths)
+                step = [node_index, key, None]
+                node_steps.append(step)
+                step[2] = cls.__compile_node(child, path + (key,), parents, node_paths, node_steps,
+                                             values_fields, computed_fields)
+            elif not isinstance(child, tuple):
+                template[key] = child
+            elif child[1] is not None and not child[2]:
+                values_fields.append((node_index, key, parents[child[0]], child[1]))
+            else:
+                computed_fields.append((node_index, key, parents[child[0]], child[1], child[2]))
+        return template
+
+    @staticmethod
+    def __compile_setter(target: tuple) -> Callable[[object, object], None]:
+        parents, leaf = target[:-1], target[-1]
+        if not any(isinstance(key, int) for key in target):
+            def set_value(result: dict, value):
+                node = result
+                for key in parents:
+                    child = node.get(key)
+                    if child is None:
+                        child = node[key] = {}
+                    node = child
+                node[leaf] = value
+
+            return set_value
+
+        steps = [(key, list if isinstance(next_key, int) else dict) for key, next_key in zip(target, target[1:])]
+
+        def set_indexed_value(result: dict, value):
+            node = result
+            for key, container in steps:
+                if isinstance(node, list):
+                    node.extend([None] * (key + 1 - len(node)))
+                    child = node[key]
+                else:
+                    child = node.get(key)
+                if child is None:
+                    child = node[key] = container()
+                node = child
+            if isinstance(node, list):
+                node.extend([None] * (leaf + 1 - len(node)))
+            node[leaf] = value
+
+        return set_indexed_value
+
+    @classmethod
+    def __get_source(cls, field: dict) -> tuple:
+        # a source is (parent path, key or None for the parent itself, transform)
+        transform = field.get("transform")
+        if "value" in field:
+            constant = field.get("value")
+
+            def get_constant(sources: dict):
+                value = copy.deepcopy(constant) if isinstance(constant, (dict, list)) else constant
+                return transform(value) if transform else value
+
+            return (), None, get_constant
+        path = cls.__split_path(field.get("source"))
+        if len(path) == 1 or isinstance(path[-1], int):
+            return path, None, transform
+        return path[:-1], path[-1], transform
+
+    @classmethod
+    def __iter_sources(cls, node: dict):
+        for child in node.values():
+            if isinstance(child, dict):
+                yield from cls.__iter_sources(child)
+            elif isinstance(child, tuple):
+                yield child
+
+    @staticmethod
+    def __split_path(path: str) -> tuple:
+        return tuple(int(key) if key.isdigit() else key for key in path.split("."))
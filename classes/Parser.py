@@ -1,47 +1,123 @@
 import datetime
+import functools
+import itertools
 import json
+import multiprocessing
 import os
+import socket
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import requests
-
+from classes.BacklogFormatter import BacklogFormatter
 from classes.BaseParser import BaseParser
+from classes.BatchWriter import BatchWriter
+from classes.CustomerCache import CustomerCache
+from classes.OrderFormatter import OrderFormatter
 from classes.ParserDb import ParserDb
+from classes.Pipeline import Pipeline
+from classes.RunState import RunState
 
 
 class Parser(BaseParser):
     __auction_type = "auction"
     __need_type = "need"
     __tender_type = "tender"
+    __lock_name = "parser"
+    __formatter_version = 1
+
+    def __init__(self, parser_name: str,
+                 page_size: int = 100,
+                 max_page_requests: int = 4,
+                 query_filter: dict = None,
+                 query_order: list = None,
+                 fetch_workers: int = 1,
+                 lot_workers: int = 8,
+                 format_workers: int = 2,
+                 send_workers: int = 1,
+                 send_batch_size: int = 50,
+                 send_max_delay: float = 2,
+                 queue_size: int = 100,
+                 customer_cache_size: int = 10000,
+                 write_batch_size: int = 500,
+                 write_max_delay: float = 5,
+                 compress_blobs: bool = False,
+                 is_refreshing: bool = False,
+                 is_incremental: bool = False,
+                 incremental_field: str = "beginDate",
+                 full_sync_interval: datetime.timedelta = datetime.timedelta(days=1),
+                 lock_lease: float = 15 * 60,
+                 backlog_workers: int = os.cpu_count() or 1,
+                 backlog_threshold: int = 5000,
+                 backlog_chunk_size: int = 1000,
+                 **kwargs):
+        super().__init__(parser_name, **kwargs)
+        self._page_size = page_size
+        self._max_page_requests = max_page_requests
+        self._query_filter = query_filter if query_filter else {
+            "auctionSpecificFilter": {"stateIdIn": [19000002]},
+            "needSpecificFilter": {"stateIdIn": [20000002]},
+            "tenderSpecificFilter": {"stateIdIn": [5]}
+        }
+        self._is_incremental = is_incremental
+        self._incremental_field = incremental_field
+        self._full_sync_interval = full_sync_interval
+        if query_order:
+            self._query_order = query_order
+        elif is_incremental:
+            # the listing is sorted by the same field that stops paging at the high-water mark
+            self._query_order = [{"field": incremental_field, "desc": True}]
+        else:
+            self._query_order = [{"field": "relevance", "desc": True}]
+        self._fetch_workers = fetch_workers
+        self._lot_workers = lot_workers
+        self._format_workers = format_workers
+        self._send_workers = send_workers
+        self._send_batch_size = send_batch_size
+        self._send_max_delay = send_max_delay
+        self._queue_size = queue_size
+        self.__lot_executor = ThreadPoolExecutor(max_workers=lot_workers)
+        self.__formatter = OrderFormatter(self._get_formatter_specs(), self._get_order_sources)
+        self.__customer_cache = CustomerCache(customer_cache_size)
+        self._write_batch_size = write_batch_size
+        self._write_max_delay = write_max_delay
+        self._compress_blobs = compress_blobs
+        self._is_refreshing = is_refreshing
+        self.__listing_high_water_mark = None
+        self._lock_lease = lock_lease
+        self.__lock_owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._backlog_workers = backlog_workers
+        self._backlog_threshold = backlog_threshold
+        self._backlog_chunk_size = backlog_chunk_size
 
     def start(self):
         time_start = datetime.datetime.now()
         print(f"[PARSER] Парсер начал работу в {time_start.strftime('%d.%m.%Y, %H:%M:%S')}")
 
         self.add_logger_info("Парсер начал работу")
+        self._get_retry_policy().reset_budget()
 
         result = {
             "new_orders": -1,
             "errors": -1
         }
 
-        mos_url = "https://old.zakupki.mos.ru/api/Cssp/Purchase/Query?queryDto=%7B%22filter%22%3A%7B%22auctionSpecificFilter%22%3A%7B%22stateIdIn%22%3A%5B19000002%5D%7D%2C%22needSpecificFilter%22%3A%7B%22stateIdIn%22%3A%5B20000002%5D%7D%2C%22tenderSpecificFilter%22%3A%7B%22stateIdIn%22%3A%5B5%5D%7D%7D%2C%22order%22%3A%5B%7B%22field%22%3A%22relevance%22%2C%22desc%22%3Atrue%7D%5D%2C%22withCount%22%3Atrue%2C%22skip%22%3A0%7D"
-        data_filepath = "./data.json"
-        if os.path.exists(data_filepath):
-            print(f"[ERROR] Файл {data_filepath} существует, новые заказы не могут быть загруженыt")
-            self.add_logger_error(f"Файл {data_filepath} существует, новые заказы не могут быть загружены")
-            # os.remove(f"{data_filepath}")
-            # logger.info(f"{data_filepath} deleted")
-        else:
-            self.__create_data_file(mos_url, data_filepath)
-
-            db = ParserDb("zakupkimos.db")
-            db.create_table_orders()
-            db.create_table_customers()
-            self.__add_data_to_db(data_filepath, db)
-            result = self.__send_orders_from_db(db)
-            os.remove(f"{data_filepath}")
-            print(f"[INFO] Файл {data_filepath} успешно удален")
-            self.add_logger_info(f"Файл {data_filepath} успешно удален")
+        try:
+            with ParserDb("zakupkimos.db", compress_blobs=self._compress_blobs) as db:
+                db.create_table_locks()
+                if not self.__acquire_lock(db):
+                    lock = db.get_lock(self.__lock_name)
+                    print(f"[ERROR] Парсер уже запущен ({lock.get('owner')}), новые заказы не могут быть загружены")
+                    self.add_logger_error(f"Парсер уже запущен ({lock.get('owner')}), "
+                                          f"новые заказы не могут быть загружены")
+                else:
+                    try:
+                        db.migrate()
+                        result = self.__run(db)
+                    finally:
+                        db.release_lock(self.__lock_name, self.__lock_owner)
+        finally:
+            self._get_sender().close()
 
         time_finish = datetime.datetime.now()
         print(f"[PARSER] Парсер закончил работу в {time_finish.strftime('%d.%m.%Y, %H:%M:%S')}. "
@@ -69,8 +145,134 @@ class Parser(BaseParser):
     def _get_document_url(document_id: str) -> str:
         return f"https://zakupki.mos.ru/newapi/api/FileStorage/Download?id={document_id}"
 
-    def __add_customer_to_db(self, db: ParserDb, customer_id: str) -> bool:
-        db_customer = db.get_customer_by_customer_id(customer_id)
+    @classmethod
+    def _get_formatter_specs(cls) -> dict:
+        def get_attachments(files):
+            return [{
+                "docDescription": doc.get("name"),
+                "url": cls._get_document_url(doc.get("id"))
+            } for doc in files]
+
+        def get_contact_person(contact_person):
+            return dict(zip(("lastName", "firstName"), contact_person.split())) if contact_person else {}
+
+        def get_okpd_codes(items):
+            return [{"code": item.get("okpd").get("code")} for item in items]
+
+        def get_tender_attachments(register_number):
+            return [{
+                "docDescription": "Сведения о процедуре закупки в Единой информационной системе",
+                "url": f"https://zakupki.gov.ru/epz/order/notice/ok504/view/common-info.html?regNumber={register_number}"
+            }, {
+                "docDescription": "Документация в ЕИС",
+                "url": f"https://zakupki.gov.ru/epz/order/notice/ok504/view/documents.html?regNumber={register_number}"
+            }, {
+                "docDescription": "Протоколы в ЕИС",
+                "url": f"https://zakupki.gov.ru/epz/order/notice/ok504/view/documents.html?regNumber={register_number}"
+            }]
+
+        customer_fields = [
+            {"target": "customer.factAddress", "source": "customer.company.factAddress", "is_optional": True},
+            {"target": "customer.inn", "source": "customer.company.inn", "is_optional": True},
+            {"target": "customer.kpp", "source": "customer.company.kpp", "is_optional": True},
+        ]
+        return {
+            cls.__need_type: [
+                {"target": "fz", "value": "ЗМО"},
+                {"target": "purchaseNumber", "source": "data.number"},
+                {"target": "url", "source": "order.url"},
+                {"target": "title", "source": "data.name"},
+                {"target": "purchaseType", "value": "Закупка по потребности"},
+                {"target": "procedureInfo.endDate", "source": "data.endDate"},
+                {"target": "lots.0.price", "source": "detail.nmck"},
+                {"target": "lots.0.customerRequirements.0.kladrPlaces.0.deliveryPlace",
+                 "source": "detail.deliveryPlace"},
+                {"target": "ETP.name", "value": "zakupki.mos.ru"},
+                {"target": "attachments", "source": "detail.files", "transform": get_attachments},
+                {"target": "type", "value": 2},
+                *customer_fields,
+                {"target": "contactPerson", "source": "detail.contactPerson", "transform": get_contact_person,
+                 "is_optional": True},
+                {"target": "contactPerson.contactEMail", "source": "detail.contactEmail", "is_optional": True},
+                {"target": "contactPerson.contactPhone", "source": "detail.contactPhone", "is_optional": True},
+                {"target": "lots.0.lotItems", "source": "detail.items", "transform": get_okpd_codes,
+                 "is_optional": True},
+            ],
+            cls.__auction_type: [
+                {"target": "fz", "value": "ЗМО"},
+                {"target": "purchaseNumber", "source": "data.number"},
+                {"target": "url", "source": "order.url"},
+                {"target": "title", "source": "data.name"},
+                {"target": "purchaseType", "value": "Котировочная сессия"},
+                {"target": "procedureInfo.endDate", "source": "data.endDate"},
+                {"target": "lots.0.price", "source": "detail.startCost"},
+                {"target": "lots.0.customerRequirements.0.kladrPlaces", "source": "detail.deliveries.0.deliveryPlace"},
+                {"target": "lots.0.customerRequirements.0.obesp_i", "source": "detail.contractGuaranteeAmount"},
+                {"target": "ETP.name", "value": "zakupki.mos.ru"},
+                {"target": "attachments", "source": "detail.files", "transform": get_attachments},
+                {"target": "type", "value": 2},
+                *customer_fields,
+                {"target": "lots.0.lotItems", "source": "lots", "transform": get_okpd_codes, "is_optional": True},
+            ],
+            cls.__tender_type: [
+                {"target": "fz", "value": "ЗМО"},
+                {"target": "purchaseNumber", "source": "data.registrationNumber"},
+                {"target": "url", "source": "order.url"},
+                {"target": "title", "source": "detail.name"},
+                {"target": "purchaseType", "value": "Закупка 44-ФЗ и 223-ФЗ"},
+                {"target": "procedureInfo.endDate", "source": "data.endDate"},
+                {"target": "lots.0.price", "source": "detail.sum"},
+                {"target": "lots.0.customerRequirements.0.kladrPlaces.0.deliveryPlace",
+                 "source": "detail.lot.0.lotSpecification.0.deliveryPlace"},
+                {"target": "ETP.name", "value": "zakupki.mos.ru"},
+                {"target": "attachments", "source": "detail.registerNumber", "transform": get_tender_attachments},
+                {"target": "type", "value": 2},
+                *customer_fields,
+            ],
+        }
+
+    @classmethod
+    def _get_order_sources(cls, row: tuple) -> tuple:
+        order, customer = row
+        order_type = order.get("order_type")
+        if order_type == cls.__auction_type and not order.get("order_lots"):
+            raise ValueError(f"Нет информации о лотах аукциона {order.get('order_id')}")
+
+        return order_type, {
+            "order": order,
+            "data": json.loads(order.get("order_data")),
+            "detail": json.loads(order.get("order_detail")),
+            "customer": customer,
+            "lots": json.loads(order.get("order_lots")) if order.get("order_lots") else None
+        }
+
+    def _get_purchase_query_api_url(self, skip: int, with_count: bool = False) -> str:
+        query_dto = {
+            "filter": self._query_filter,
+            "order": self._query_order,
+            "withCount": with_count,
+            "skip": skip,
+            "take": self._page_size
+        }
+        query = urllib.parse.urlencode({"queryDto": json.dumps(query_dto, separators=(",", ":"))},
+                                       quote_via=urllib.parse.quote)
+        return f"https://old.zakupki.mos.ru/api/Cssp/Purchase/Query?{query}"
+
+    def __acquire_lock(self, db: ParserDb) -> bool:
+        if db.acquire_lock(self.__lock_name, self.__lock_owner, os.getpid(), self._lock_lease):
+            return True
+
+        lock = db.get_lock(self.__lock_name)
+        lock_host = lock.get("owner", "").rsplit(":", 1)[0]
+        if lock_host == socket.gethostname() and not self.__is_process_alive(lock.get("pid")):
+            print(f"[INFO] Снята блокировка завершившегося процесса {lock.get('owner')}")
+            self.add_logger_info(f"Снята блокировка завершившегося процесса {lock.get('owner')}")
+            db.release_lock(self.__lock_name, lock.get("owner"))
+            return db.acquire_lock(self.__lock_name, self.__lock_owner, os.getpid(), self._lock_lease)
+        return False
+
+    def __add_customer_to_db(self, db: ParserDb, customer_writer: BatchWriter, customer_id: str) -> bool:
+        db_customer = self.__get_db_customer(db, customer_id)
         if db_customer:
             # print(f"[ALREADY EXIST] Заказчик уже существует в БД - ({customer_id})")
             # self.add_logger_info(f"Заказчик уже существует в БД - ({customer_id})")
@@ -85,78 +287,58 @@ class Parser(BaseParser):
                 self.add_logger_error(f"Ошибка при получении заказчика: {customer_url}")
                 return False
             else:
-                db.add_customer(
-                    url=customer_url,
-                    customer_id=customer_id,
-                    customer_data=json.dumps(customer, ensure_ascii=False)
-                )
+                customer_data = json.dumps(customer, ensure_ascii=False)
+                customer_writer.add((customer_url, customer_id, customer_data))
+                self.__customer_cache.add({
+                    "created_at": datetime.datetime.now(),
+                    "url": customer_url,
+                    "customer_id": customer_id,
+                    "customer_data": customer_data
+                })
                 print(f"[SUCCESS] Заказчик {customer_id} успешно добавлен в БД")
                 # self.add_logger_info(f"Заказчик {customer_id} успешно добавлен в БД")
                 return True
 
-    def __add_data_to_db(self, json_filepath: str, db: ParserDb):
-        data = self.read_json_file(json_filepath)
-        count_all_item = data["count"]
-        count = 0
-        print("[START] Начало добавления заказов в БД")
-        for item in data["items"]:
-            count += 1
-            iter_info = f"#{count} / {count_all_item}"
-            print(f"{iter_info}: [ORDER] Заказ ({item.get('number')}) {item.get('name')}")
-            # self.add_logger_info(f"Заказ ({item.get('number')}) {item.get('name')}")
-
-            if not self.__check_order(item):
-                continue
-
-            customer_id = item.get('customers')[0].get('id')
-            self.__add_customer_to_db(db, customer_id)
-
-            item_type = self.__get_item_type(item)
-            item_id = self.__get_item_id(item_type, item)
-            self.__add_order_to_db(db, item_type, item_id, item, customer_id)
-        print("[FINISH] Конец добавления заказов в БД\n")
-
-    def __add_order_to_db(self, db: ParserDb, order_type: str, order_id: str,
+    def __add_order_to_db(self, order_writer: BatchWriter, order_type: str, order_id: str,
                           order_data: dict, customer_id: str) -> bool:
-        db_order = db.get_order_by_order_id(order_id)
-        if db_order:
-            # print(f"[ALREADY EXIST] Заказ уже существует в БД - ({order_id})")
-            # self.add_logger_info(f"Заказ уже существует в БД - ({order_id})")
+        item_url = self.__get_item_url(order_type, order_id)
+        item_api_url = self.__get_item_api_url(order_type, order_id)
+        item_detail = self.__get_item(item_api_url)
+
+        if item_detail == {} or item_detail.get("httpStatusCode") == 404:
+            print(f"[ERROR] Ошибка при получении детальной инф-ции о заказе: {item_url}")
+            self.add_logger_error(f"Ошибка при получении детальной инф-ции о заказе: {item_url}")
+            return False
+        elif not self.__check_order_state(item_detail.get("state").get("id")):
+            print(f"[ERROR] Заказ имеет некорректный статус: {item_url}")
+            self.add_logger_error(f"Заказ имеет некорректный статус: {item_url}")
+            order_writer.add((
+                item_url,
+                order_type,
+                order_id,
+                "Заказ имеет некорректный статус",
+                f"Статус - {item_detail.get('state').get('name')}",
+                customer_id,
+                1,
+                "",
+                None
+            ))
             return False
         else:
-            item_url = self.__get_item_url(order_type, order_id)
-            item_api_url = self.__get_item_api_url(order_type, order_id)
-            item_detail = self.__get_item(item_api_url)
-
-            if not self.__check_order_state(item_detail.get("state").get("id")):
-                print(f"[ERROR] Заказ имеет некорректный статус: {item_url}")
-                self.add_logger_error(f"Заказ имеет некорректный статус: {item_url}")
-                db.add_order(
-                    url=item_url,
-                    order_type=order_type,
-                    order_id=order_id,
-                    order_data="Заказ имеет некорректный статус",
-                    order_detail=f"Статус - {item_detail.get('state').get('name')}",
-                    customer_id=customer_id,
-                    was_send=1
-                )
-                return False
-            elif item_detail == {} or item_detail.get("httpStatusCode") == 404:
-                print(f"[ERROR] Ошибка при получении детальной инф-ции о заказе: {item_url}")
-                self.add_logger_error(f"Ошибка при получении детальной инф-ции о заказе: {item_url}")
-                return False
-            else:
-                db.add_order(
-                    url=item_url,
-                    order_type=order_type,
-                    order_id=order_id,
-                    order_data=json.dumps(order_data, ensure_ascii=False),
-                    order_detail=json.dumps(item_detail, ensure_ascii=False),
-                    customer_id=customer_id
-                )
-                print(f"[SUCCESS] Заказ {order_id} успешно добавлен в БД")
-                # self.add_logger_info(f"Заказ {order_id} успешно добавлен в БД")
-                return True
+            order_writer.add((
+                item_url,
+                order_type,
+                order_id,
+                json.dumps(order_data, ensure_ascii=False),
+                json.dumps(item_detail, ensure_ascii=False),
+                customer_id,
+                0,
+                ParserDb.get_detail_hash(order_data, item_detail),
+                self.__get_order_lots(order_type, item_detail)
+            ))
+            print(f"[SUCCESS] Заказ {order_id} успешно добавлен в БД")
+            # self.add_logger_info(f"Заказ {order_id} успешно добавлен в БД")
+            return True
 
     def __check_order(self, order) -> bool:
         dont_send = [
@@ -183,212 +365,187 @@ class Parser(BaseParser):
         else:
             return False
 
-    def __create_data_file(self, url: str, json_filepath: str) -> bool:
-        try:
-            response = requests.get(
-                url,
-                headers=self._get_headers()
-            )
-        except requests.exceptions.RequestException as err:
-            print("[ERROR] Ошибка при запросе на получении списка заказов с сайта zakupki.mos")
-            self.add_logger_error("Ошибка при запросе на получении списка заказов с сайта zakupki.mos")
-            self.add_logger_error(err.response.content)
-            return False
-
-        self._to_sleep()
-
-        self.write_json_file(json_filepath, response.json())
-        print(f"[FILE CREATED] Файл {json_filepath} со списком заказов успешно создан")
-        self.add_logger_info(f"Файл {json_filepath} со списком заказов успешно создан")
-
-        return True
-
-    def __formatted_order_need(self, order, customer) -> dict:
-        order_data = json.loads(order.get("order_data"))
-        order_detail = json.loads(order.get("order_detail"))
-        order_url = order.get("url")
-
-        customer_detail = json.loads(customer.get("customer_data"))
-        result = {
-            "fz": "ЗМО",
-            "purchaseNumber": order_data.get("number"),
-            "url": order_url,
-            "title": order_data.get("name"),
-            "purchaseType": "Закупка по потребности",
-            "procedureInfo": {
-                "endDate": order_data.get("endDate")
-            },
-            "lots": [{
-                "price": order_detail.get("nmck"),
-                "customerRequirements": [{
-                    "kladrPlaces": [{
-                        "deliveryPlace": order_detail.get("deliveryPlace"),
-                    }]
-                }],
-            }],
-            "ETP": {
-                "name": "zakupki.mos.ru"
-            },
-            "attachments": [{
-                "docDescription": doc.get("name"),
-                "url": self._get_document_url(doc.get('id'))
-            } for doc in order_detail.get("files")],
-            "type": 2
-        }
+    def __checkpoint_pages(self, db: ParserDb, state: RunState, checkpoint: tuple):
+        if not checkpoint:
+            return
+
+        skip, page = checkpoint
+        state.flush_writers()
+        db.update_run(state.get_run().get("run_id"), {
+            "listing_skip": skip + self._page_size,
+            "count_all_item": state.get_count_all_item(),
+            "processed_items": page.get("processed_items")
+        })
+        self.__renew_lock(db, state)
+
+    def __complete_page_item(self, db: ParserDb, state: RunState, skip: int):
+        # checkpoints are written under the run lock so a later page never lands before an earlier one
+        with state.get_lock():
+            self.__checkpoint_pages(db, state, state.complete_page_item(skip))
+
+    def __create_batch_writer(self, write) -> BatchWriter:
+        return BatchWriter(write, self._write_batch_size, self._write_max_delay)
+
+    def __create_run_state(self, db: ParserDb, run: dict) -> RunState:
+        if self._is_refreshing:
+            state = RunState(run, db.get_all_order_hashes())
+        else:
+            state = RunState(run, db.get_all_order_keys())
+
+        state.set_writer("customer", self.__create_batch_writer(db.add_customers))
+        state.set_writer("order", self.__create_batch_writer(functools.partial(self.__store_orders, db, state)))
+        state.set_writer("refresh", self.__create_batch_writer(
+            functools.partial(self.__store_refreshed_orders, db, state)))
+        state.set_writer("hash", self.__create_batch_writer(db.update_order_hashes))
+        state.set_writer("payload", self.__create_batch_writer(db.update_order_payloads))
+        state.set_writer("delivery", BatchWriter(functools.partial(self.__deliver_orders, db, state),
+                                                 self._send_batch_size, self._send_max_delay))
+        return state
+
+    def __deliver_orders(self, db: ParserDb, state: RunState, pipeline_orders: list) -> bool:
+        state.get_writer("payload").flush()
+        results = self._send_order_batch([formatted_order for order, formatted_order in pipeline_orders])
+        sent_order_keys = []
+        for (order, formatted_order), is_sent in zip(pipeline_orders, results):
+            if is_sent:
+                sent_order_keys.append((order.get("order_type"), order.get("order_id")))
+                print(f"[SUCCESS] Заказ успешно отправлен по API: {order.get('url')}")
+                self.add_logger_info(f"Заказ успешно отправлен по API: {order.get('url')}")
+            else:
+                print(f"[ERROR] Заказ не отправлен по API: {order.get('url')}")
+                self.add_logger_error(f"Заказ не отправлен по API: {order.get('url')}")
 
-        # customer
-        if customer_detail.get("company").get("factAddress"):
-            if "customer" not in result:
-                result.update({"customer": {}})
-            result["customer"].update({"factAddress": customer_detail.get("company").get("factAddress")})
-
-        if customer_detail.get("company").get("inn"):
-            if "customer" not in result:
-                result.update({"customer": {}})
-            result["customer"].update({"inn": customer_detail.get("company").get("inn")})
-
-        if customer_detail.get("company").get("kpp"):
-            if "customer" not in result:
-                result.update({"customer": {}})
-            result["customer"].update({"kpp": customer_detail.get("company").get("kpp")})
-
-        # contactPerson
-        contact_name = order_detail.get("contactPerson").split() if order_detail.get("contactPerson") else ["", ""]
-        if len(contact_name) == 1:
-            contact_name.append("")
-
-        if contact_name[0]:
-            if "contactPerson" not in result:
-                result.update({"contactPerson": {}})
-            result["contactPerson"].update({"lastName": contact_name[0]})
-
-        if contact_name[1]:
-            if "contactPerson" not in result:
-                result.update({"contactPerson": {}})
-            result["contactPerson"].update({"firstName": contact_name[1]})
-
-        if order_detail.get("contactEmail"):
-            if "contactPerson" not in result:
-                result.update({"contactPerson": {}})
-            result["contactPerson"].update({"contactEMail": order_detail.get("contactEmail")})
-
-        if order_detail.get("contactPhone"):
-            if "contactPerson" not in result:
-                result.update({"contactPerson": {}})
-            result["contactPerson"].update({"contactPhone": order_detail.get("contactPhone")})
-
-        okpd_codes = [{"code": item.get("okpd").get("code")} for item in order_detail.get("items")]
-        if okpd_codes:
-            result.get("lots")[0].update({"lotItems": okpd_codes})
-
-        return result
-
-    def __formatted_order_auction(self, order, customer) -> dict:
-        order_data = json.loads(order["order_data"])
-        order_detail = json.loads(order["order_detail"])
-        order_url = order.get("url")
-        customer_data = json.loads(customer.get("customer_data"))
-
-        deliveries = order_detail.get("deliveries")[0]
+        state.increment_count_send(len(sent_order_keys))
+        state.increment_count_send_error(len(results) - len(sent_order_keys))
+        return db.mark_sent_many(sent_order_keys) if sent_order_keys else True
 
-        result = {
-            "fz": "ЗМО",
-            "purchaseNumber": order_data.get("number"),
-            "url": order_url,
-            "title": order_data.get("name"),
-            "purchaseType": "Котировочная сессия",
-            "procedureInfo": {
-                "endDate": order_data.get("endDate")
-            },
-            "lots": [{
-                "price": order_detail.get("startCost"),
-                "customerRequirements": [{
-                    "kladrPlaces": deliveries.get("deliveryPlace"),
-                    "obesp_i": order_detail.get("contractGuaranteeAmount")
-                }],
-            }],
-            "ETP": {
-                "name": "zakupki.mos.ru"
-            },
-            "attachments": [{
-                "docDescription": doc.get("name"),
-                "url": self._get_document_url(doc.get('id'))
-            } for doc in order_detail.get("files")],
-            "type": 2
-        }
+    def __fetch_pipeline_item(self, db: ParserDb, state: RunState, pipeline_item: tuple) -> list:
+        kind, skip, item = pipeline_item
+        if kind == "orders":
+            return [item + state.pop_stored_orders()]
 
-        # customer
-        if customer_data.get("company").get("factAddress"):
-            if "customer" not in result:
-                result.update({"customer": {}})
-            result["customer"].update({"factAddress": customer_data.get("company").get("factAddress")})
+        try:
+            item_type = self.__get_item_type(item)
+            item_id = self.__get_item_id(item_type, item)
+            known_order_keys = state.get_known_order_keys()
+            if (item_type, item_id) in known_order_keys:
+                self.__refresh_order_in_db(state.get_writer("refresh"), state.get_writer("hash"),
+                                           item_type, item_id, item, known_order_keys.get((item_type, item_id)))
+            else:
+                customer_id = item.get('customers')[0].get('id')
+                self.__add_customer_to_db(db, state.get_writer("customer"), customer_id)
+                self.__add_order_to_db(state.get_writer("order"), item_type, item_id, item, customer_id)
+        finally:
+            self.__complete_page_item(db, state, skip)
+        orders = state.pop_stored_orders()
+        return [orders] if orders else []
+
+    def __finish_fetch_stage(self, state: RunState) -> list:
+        state.flush_writers()
+        orders = state.pop_stored_orders()
+        return [orders] if orders else []
+
+    def __flush_deliveries(self, state: RunState, is_forced: bool) -> list:
+        if is_forced:
+            state.get_writer("delivery").flush()
+        else:
+            state.get_writer("delivery").flush_if_due()
+        return []
 
-        if customer_data.get("company").get("inn"):
-            if "customer" not in result:
-                result.update({"customer": {}})
-            result["customer"].update({"inn": customer_data.get("company").get("inn")})
+    def __format_pipeline_orders(self, db: ParserDb, state: RunState, orders: list) -> list:
+        pipeline_orders, pending_orders = [], []
+        for order in orders:
+            if order.get("payload") and order.get("payload_version") == self.__formatter_version:
+                pipeline_orders.append((order, json.loads(order.get("payload"))))
+            elif "formatted_order" in order:
+                pipeline_orders.extend(self.__get_backlog_pipeline_order(state, order))
+            else:
+                pending_orders.append(order)
 
-        if customer_data.get("company").get("kpp"):
-            if "customer" not in result:
-                result.update({"customer": {}})
-            result["customer"].update({"kpp": customer_data.get("company").get("kpp")})
+        self.__load_order_blobs(db, pending_orders)
+        rows = []
+        for order in pending_orders:
+            customer_data = self.__get_db_customer_data(db, order.get("customer_id"))
+            if customer_data is None:
+                print(f"[ERROR] По заказу {order.get('order_id')} в БД "
+                      f"нет информации о заказчике {order.get('customer_id')}")
+                self.add_logger_error(f"По заказу {order.get('order_id')} в БД "
+                                      f"нет информации о заказчике {order.get('customer_id')}")
+                continue
 
-        lots = [self.__get_auction_lot(item.get("id"))
-                for item in order_detail.get("items")]
-        okpd_codes = [{"code": lot.get("okpd").get("code")} for lot in lots]
-        if okpd_codes:
-            result.get("lots")[0].update({"lotItems": okpd_codes})
+            if order.get("order_type") == self.__auction_type and not order.get("order_lots"):
+                self.__load_order_lots(db, order)
+            rows.append((order, customer_data))
 
-        return result
+        on_error = functools.partial(self.__report_format_error, db)
+        for (order, customer), formatted_order in zip(rows, self.__formatter.format_many(rows, on_error)):
+            if not formatted_order:
+                print(f"[EMPTY ORDER] Заказ пустой: {order.get('url')}")
+                self.add_logger_info(f"Заказ пустой: {order.get('url')}")
+                state.increment_count_send_error()
+                continue
 
-    def __formatted_order_tender(self, item, detail, item_url, customer):
-        pass
+            state.get_writer("payload").add((
+                json.dumps(formatted_order, ensure_ascii=False),
+                self.__formatter_version,
+                order.get("order_type"),
+                order.get("order_id")
+            ))
+            pipeline_orders.append((order, formatted_order))
+        return pipeline_orders
 
     def __get_auction_lot(self, lot_id: str):
         url = self._get_auction_lot_api_url(lot_id)
-        try:
-            response = requests.get(
-                url=url,
-                headers=self._get_headers()
-            )
-        except requests.exceptions.RequestException as err:
-            self.add_logger_error("Ошибка при отправке запроса на получение инф-ции о лоте аукциона")
-            self.add_logger_error(err.response.content)
-            return {}
+        return self._get_json(url, "Ошибка при отправке запроса на получение инф-ции о лоте аукциона")
 
-        self._to_sleep()
-
-        return response.json()
+    def __get_backlog_pipeline_order(self, state: RunState, order: dict) -> list:
+        formatted_order = order.pop("formatted_order")
+        if not formatted_order:
+            print(f"[EMPTY ORDER] Заказ пустой: {order.get('url')}")
+            self.add_logger_info(f"Заказ пустой: {order.get('url')}")
+            state.increment_count_send_error()
+            return []
+        return [(order, formatted_order)]
 
     def __get_customer(self, customer_url: str) -> dict:
-        try:
-            response = requests.get(
-                url=customer_url,
-                headers=self._get_headers()
-            )
-        except requests.exceptions.RequestException as err:
-            self.add_logger_error("Ошибка при отправке запроса на получение инф-ции о заказчике")
-            self.add_logger_error(err.response.content)
-            return {}
-
-        self._to_sleep()
-
-        return response.json()
-
-    def __get_item(self, detail_url: str) -> dict:
-        try:
-            response = requests.get(
-                url=detail_url,
-                headers=self._get_headers()
-            )
-        except requests.exceptions.RequestException as err:
-            self.add_logger_error("Ошибка при отправке запроса на получение детальной инф-ции о заказе")
-            self.add_logger_error(err.response.content)
-            return {}
-
-        self._to_sleep()
-
-        return response.json()
+        return self._get_json(customer_url, "Ошибка при отправке запроса на получение инф-ции о заказчике")
+
+    def __get_db_customer(self, db: ParserDb, customer_id: str) -> dict:
+        customer = self.__customer_cache.get(customer_id)
+        if not customer:
+            customer = db.get_customer_by_customer_id(customer_id)
+            if customer:
+                self.__customer_cache.add(customer)
+        return customer
+
+    def __get_db_customer_data(self, db: ParserDb, customer_id: str) -> dict:
+        customer_data = self.__customer_cache.get_data(customer_id)
+        if customer_data is None:
+            customer = self.__get_db_customer(db, customer_id)
+            if customer:
+                customer_data = json.loads(customer.get("customer_data"))
+        return customer_data
+
+    def __get_high_water_mark(self, db: ParserDb):
+        if not self._is_incremental:
+            return None
+
+        last_full_sync_at = db.get_sync_state("last_full_sync_at")
+        if not last_full_sync_at or \
+                datetime.datetime.now() - datetime.datetime.fromisoformat(last_full_sync_at) > self._full_sync_interval:
+            print("[INFO] Полная сверка списка заказов")
+            self.add_logger_info("Полная сверка списка заказов")
+            return None
+
+        high_water_mark = db.get_sync_state("high_water_mark")
+        if not high_water_mark:
+            return None
+        print(f"[INFO] Инкрементальная загрузка заказов, опубликованных после {high_water_mark}")
+        return datetime.datetime.fromisoformat(high_water_mark)
+
+    def __get_item(self, detail_url: str, is_revalidating: bool = False) -> dict:
+        return self._get_json(detail_url, "Ошибка при отправке запроса на получение детальной инф-ции о заказе",
+                              is_revalidating=is_revalidating)
 
     def __get_item_api_url(self, item_type: str, item_id: str) -> str:
         if item_type == self.__auction_type:
@@ -409,6 +566,18 @@ class Parser(BaseParser):
         elif item_type == self.__tender_type:
             return str(item['tenderId'])
 
+    def __get_item_timestamp(self, item: dict):
+        value = item.get(self._incremental_field)
+        if not value:
+            return None
+        try:
+            timestamp = datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return timestamp
+
     def __get_item_type(self, item: dict) -> str:
         if item.get("auctionId"):
             return self.__auction_type
@@ -425,63 +594,319 @@ class Parser(BaseParser):
         elif item_type == self.__tender_type:
             return f"https://old.zakupki.mos.ru/#/tenders/{item_id}"
 
-    def __send_orders_from_db(self, db: ParserDb):
-        orders = db.get_unsent_orders()
-        count_all_orders = len(orders)
-        count, count_send, count_send_error = 0, 0, 0
-        print("[START] Начало отправки заказов по API")
+    def __get_listing_page(self, skip: int, with_count: bool = False) -> dict:
+        url = self._get_purchase_query_api_url(skip, with_count)
+        page = self._get_json(url, "Ошибка при запросе на получении списка заказов с сайта zakupki.mos",
+                              stream_key="items")
+        if not page:
+            print(f"[ERROR] Ошибка при запросе на получении списка заказов с сайта zakupki.mos (skip={skip})")
+        return page
+
+    def __get_order_lots(self, order_type: str, order_detail: dict):
+        if order_type != self.__auction_type:
+            return None
+
+        lot_ids = [item.get("id") for item in order_detail.get("items") or []]
+        lots = list(self.__lot_executor.map(self.__get_auction_lot, lot_ids))
+        if not all(self.__is_lot_loaded(lot) for lot in lots):
+            return None
+        return json.dumps(lots, ensure_ascii=False)
+
+    def __get_run_high_water_mark(self, run: dict):
+        if run.get("high_water_mark"):
+            return datetime.datetime.fromisoformat(run.get("high_water_mark"))
+        return None
 
-        if count_all_orders == 0:
-            print("[INFO] Новых заказов нет")
-            self.add_logger_info("Новых заказов нет")
-        for order in orders:
-            count += 1
-            iter_info = f"#{count} / {count_all_orders}"
+    @staticmethod
+    def __is_lot_loaded(lot: dict) -> bool:
+        # the API reports some errors in a 200 response body, such a lot is fetched again later
+        return bool(lot) and bool(lot.get("okpd")) and (lot.get("httpStatusCode") or 200) < 400
 
-            order_data = json.loads(order.get("order_data"))
-            # print(f"{iter_info}: [ORDER] Заказ ({order_data.get('number')}) {order_data.get('name')}")
+    def __is_page_synced(self, page: dict, high_water_mark: datetime.datetime) -> bool:
+        timestamps = [self.__get_item_timestamp(item) for item in page.get("items", [])]
+        return any(timestamp and timestamp < high_water_mark for timestamp in timestamps)
 
-            order_type = order.get("order_type")
-            customer = db.get_customer_by_customer_id(order.get("customer_id"))
-            formatted_order = {}
+    @staticmethod
+    def __is_process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
 
-            if not customer:
-                print(f"[ERROR] По заказу {order.get('order_id')} в БД "
-                      f"нет информации о заказчике {order.get('customer_id')}")
-                self.add_logger_error(f"По заказу {order.get('order_id')} в БД "
-                                      f"нет информации о заказчике {order.get('customer_id')}")
-                continue
+    def __iter_backlog_orders(self, db: ParserDb):
+        backlog_formatter = BacklogFormatter("zakupkimos.db", Parser._get_formatter_specs, Parser._get_order_sources,
+                                             self.__formatter_version, self._compress_blobs, (self.__auction_type,))
+        rowid_ranges = iter(db.get_unsent_rowid_ranges(self._backlog_chunk_size))
+        # threads are already running, so worker processes are spawned instead of forked
+        with ProcessPoolExecutor(max_workers=self._backlog_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending = deque()
+            for rowid_range in itertools.islice(rowid_ranges, self._backlog_workers * 2):
+                pending.append(executor.submit(backlog_formatter.format_range, rowid_range))
+            while pending:
+                future = pending.popleft()
+                for rowid_range in itertools.islice(rowid_ranges, 1):
+                    pending.append(executor.submit(backlog_formatter.format_range, rowid_range))
+                yield "orders", None, future.result()
+
+    def __iter_listing_pages(self, high_water_mark: datetime.datetime = None, start_skip: int = 0):
+        self.__listing_high_water_mark = None
+        first_page = self.__get_listing_page(start_skip, with_count=True)
+        yield start_skip, self.__track_high_water_mark(first_page)
+        if not first_page:
+            return
+
+        count_all_item = first_page.get("count") or 0
+        if high_water_mark:
+            page, skip = first_page, start_skip
+            while page.get("items") and not self.__is_page_synced(page, high_water_mark):
+                skip += self._page_size
+                if skip >= count_all_item:
+                    break
+                page = self.__get_listing_page(skip)
+                yield skip, self.__track_high_water_mark(page)
+            return
+
+        skips = iter(range(start_skip + self._page_size, count_all_item, self._page_size))
+        with ThreadPoolExecutor(max_workers=self._max_page_requests) as executor:
+            pending = deque()
+            for skip in itertools.islice(skips, self._max_page_requests):
+                pending.append((skip, executor.submit(self.__get_listing_page, skip)))
+            while pending:
+                skip, future = pending.popleft()
+                for next_skip in itertools.islice(skips, 1):
+                    pending.append((next_skip, executor.submit(self.__get_listing_page, next_skip)))
+                page = future.result()
+                yield skip, self.__track_high_water_mark(page)
+                if not page:
+                    return
+
+    def __iter_pipeline_items(self, db: ParserDb, state: RunState):
+        count_unsent = db.get_unsent_order_count()
+        if count_unsent:
+            print(f"[INFO] Ранее не отправленных заказов: {count_unsent}")
+        if self._backlog_workers > 1 and count_unsent >= self._backlog_threshold:
+            yield from self.__iter_backlog_orders(db)
+        else:
+            orders = db.iter_unsent_payloads(batch_size=self._queue_size)
+            for batch in iter(lambda: list(itertools.islice(orders, self._send_batch_size)), []):
+                yield "orders", None, batch
+
+        run = state.get_run()
+        if run.get("stage") != "listing":
+            return
+
+        count = run.get("processed_items")
+        item_keys = set()
+        known_order_keys = state.get_known_order_keys()
+        high_water_mark = self.__get_run_high_water_mark(run)
+        for skip, page in self.__iter_listing_pages(high_water_mark, run.get("listing_skip")):
+            if not page:
+                # the checkpoint stays before the failed page, the next start resumes from it
+                break
+            state.set_count_all_item(page.get("count") or state.get_count_all_item())
+            items = []
+            for item in page.get("items", []):
+                count += 1
+                iter_info = f"#{count} / {state.get_count_all_item()}"
+                print(f"{iter_info}: [ORDER] Заказ ({item.get('number')}) {item.get('name')}")
+                # self.add_logger_info(f"Заказ ({item.get('number')}) {item.get('name')}")
+
+                if not self.__check_order(item):
+                    continue
+
+                item_type = self.__get_item_type(item)
+                item_id = self.__get_item_id(item_type, item)
+                if (item_type, item_id) in item_keys:
+                    continue
+                item_keys.add((item_type, item_id))
+
+                if (item_type, item_id) in known_order_keys and not self._is_refreshing:
+                    continue
+                items.append(item)
+
+            self.__register_page(db, state, skip, len(items), count)
+            for item in items:
+                yield "item", skip, item
+        else:
+            state.set_listing_loaded()
+
+    def __load_customer_cache(self, db: ParserDb):
+        self.__customer_cache.clear()
+        customers = db.get_all_customers(limit=self.__customer_cache.get_max_size())
+        for customer in reversed(customers.values()):
+            self.__customer_cache.add(customer)
+
+    def __load_order_blobs(self, db: ParserDb, orders: list):
+        # replayed orders come without blobs, they are read only for the orders without an up-to-date payload
+        order_keys = [(order.get("order_type"), order.get("order_id")) for order in orders if "order_data" not in order]
+        if not order_keys:
+            return
+        order_blobs = db.get_order_blobs(order_keys)
+        for order in orders:
+            if "order_data" not in order:
+                order.update(order_blobs.get((order.get("order_type"), str(order.get("order_id"))), {}))
+
+    def __load_order_lots(self, db: ParserDb, order: dict):
+        order_lots = self.__get_order_lots(order.get("order_type"), json.loads(order.get("order_detail")))
+        if order_lots:
+            db.update_order_lots([(order_lots, order.get("order_type"), order.get("order_id"))])
+            order["order_lots"] = order_lots
+
+    def __refresh_order_in_db(self, refresh_writer: BatchWriter, hash_writer: BatchWriter,
+                              order_type: str, order_id: str, order_data: dict, stored_hash: str) -> bool:
+        item_url = self.__get_item_url(order_type, order_id)
+        # a fresh cache entry may predate the change the refresh is looking for, so it is always revalidated
+        item_detail = self.__get_item(self.__get_item_api_url(order_type, order_id), is_revalidating=True)
+        if item_detail == {} or item_detail.get("httpStatusCode") == 404:
+            print(f"[ERROR] Ошибка при обновлении детальной инф-ции о заказе: {item_url}")
+            self.add_logger_error(f"Ошибка при обновлении детальной инф-ции о заказе: {item_url}")
+            return False
+        elif not self.__check_order_state(item_detail.get("state").get("id")):
+            return False
 
-            try:
-                if order_type == self.__auction_type:
-                    formatted_order = self.__formatted_order_auction(order, customer)
-                elif order_type == self.__need_type:
-                    formatted_order = self.__formatted_order_need(order, customer)
-                elif order_type == self.__tender_type:
-                    # order = self.formatted_order_tender(order_data, order_detail, order_url, customer)
-                    formatted_order = {}
-            except Exception as err:
-                print(f"[ERROR] Ошибка при создании заказа для отправки по API: {order.get('url')}")
-                self.add_logger_error(f"Ошибка при создании заказа для отправки по API: {order.get('url')}")
-                self.add_logger_error(err)
-            if formatted_order:
-                if self._send_orders([formatted_order]):
-                    db.update_send_on_success(order.get("order_id"))
-                    print(f"[SUCCESS] Заказ успешно отправлен по API: {order.get('url')}")
-                    self.add_logger_info(f"Заказ успешно отправлен по API: {order.get('url')}")
-                    count_send += 1
-                else:
-                    print(f"[ERROR] Заказ не отправлен по API: {order.get('url')}")
-                    self.add_logger_error(f"Заказ не отправлен по API: {order.get('url')}")
-                    count_send_error += 1
-            else:
-                print(f"[EMPTY ORDER] Заказ пустой: {order.get('url')}")
-                self.add_logger_info(f"Заказ пустой: {order.get('url')}")
-                count_send_error += 1
+        detail_hash = ParserDb.get_detail_hash(order_data, item_detail)
+        if detail_hash == stored_hash:
+            return False
+        elif not stored_hash:
+            hash_writer.add((detail_hash, order_type, order_id))
+            return False
+
+        refresh_writer.add((
+            json.dumps(order_data, ensure_ascii=False),
+            json.dumps(item_detail, ensure_ascii=False),
+            self.__get_order_lots(order_type, item_detail),
+            detail_hash,
+            order_type,
+            order_id
+        ))
+        print(f"[UPDATED] Заказ {order_id} изменился и будет отправлен повторно")
+        self.add_logger_info(f"Заказ {order_id} изменился и будет отправлен повторно")
+        return True
 
-        print("[FINISH] Конец отправки заказов по API\n")
+    def __register_page(self, db: ParserDb, state: RunState, skip: int, items_count: int, processed_items: int):
+        with state.get_lock():
+            self.__checkpoint_pages(db, state, state.register_page(skip, items_count, processed_items))
+
+    def __renew_lock(self, db: ParserDb, state: RunState):
+        if state.is_lock_renewal_due(self._lock_lease / 3):
+            self.__acquire_lock(db)
+
+    def __report_format_error(self, db: ParserDb, row: tuple, err: Exception):
+        order, customer = row
+        print(f"[ERROR] Ошибка при создании заказа для отправки по API: {order.get('url')}")
+        self.add_logger_error(f"Ошибка при создании заказа для отправки по API: {order.get('url')}")
+        self.add_logger_error(err)
+        if order.get("order_type") == self.__auction_type and order.get("order_lots"):
+            # stored lots may be an error body saved before it was recognized, the next run fetches them again
+            db.update_order_lots([(None, order.get("order_type"), order.get("order_id"))])
+
+    def __run(self, db: ParserDb) -> dict:
+        run = db.get_unfinished_run()
+        if run:
+            print(f"[INFO] Продолжение прерванного запуска #{run.get('run_id')} "
+                  f"(этап {run.get('stage')}, обработано {run.get('processed_items')} заказов)")
+            self.add_logger_info(f"Продолжение прерванного запуска #{run.get('run_id')}")
+            db.update_run(run.get("run_id"), {"pid": os.getpid()})
+        else:
+            high_water_mark = self.__get_high_water_mark(db)
+            run = db.create_run(os.getpid(), high_water_mark.isoformat() if high_water_mark else "")
+
+        self.__load_customer_cache(db)
+        state = self.__create_run_state(db, run)
+        pipeline = Pipeline(self._queue_size)
+        pipeline.add_stage("fetch", functools.partial(self.__fetch_pipeline_item, db, state),
+                           self._fetch_workers,
+                           on_finish=functools.partial(self.__finish_fetch_stage, state))
+        pipeline.add_stage("format", functools.partial(self.__format_pipeline_orders, db, state),
+                           self._format_workers)
+        pipeline.add_stage("send", functools.partial(self.__send_pipeline_order, db, state),
+                           self._send_workers,
+                           on_finish=functools.partial(self.__flush_deliveries, state, True),
+                           on_idle=functools.partial(self.__flush_deliveries, state, False))
+
+        print("[START] Начало загрузки и отправки заказов")
+        pipeline.run(self.__iter_pipeline_items(db, state))
+        for stage_name, item, err in pipeline.get_errors():
+            print(f"[ERROR] Ошибка на этапе {stage_name}: {err}")
+            self.add_logger_error(f"Ошибка на этапе {stage_name}: {err}")
+        if state.get_count_send() + state.get_count_send_error() == 0:
+            print("[INFO] Новых заказов нет")
+            self.add_logger_info("Новых заказов нет")
+        print("[FINISH] Конец загрузки и отправки заказов\n")
+
+        if run.get("stage") == "listing" and not state.is_listing_loaded():
+            print(f"[ERROR] Список заказов загружен не полностью, "
+                  f"запуск #{run.get('run_id')} будет продолжен при следующем старте")
+            self.add_logger_error(f"Список заказов загружен не полностью, "
+                                  f"запуск #{run.get('run_id')} будет продолжен при следующем старте")
+        else:
+            if run.get("stage") == "listing":
+                self.__save_sync_state(db, is_full_sync=not run.get("high_water_mark"))
+            db.update_run(run.get("run_id"), {"status": "finished", "stage": "finished"})
 
         return {
-            "new_orders": count_send,
-            "errors": count_send_error,
+            "new_orders": state.get_count_send(),
+            "errors": state.get_count_send_error()
         }
+
+    def __save_sync_state(self, db: ParserDb, is_full_sync: bool):
+        sync_state = {}
+        stored_high_water_mark = db.get_sync_state("high_water_mark")
+        if self.__listing_high_water_mark and (
+                not stored_high_water_mark or
+                self.__listing_high_water_mark > datetime.datetime.fromisoformat(stored_high_water_mark)):
+            sync_state["high_water_mark"] = self.__listing_high_water_mark.isoformat()
+        if is_full_sync:
+            sync_state["last_full_sync_at"] = datetime.datetime.now().isoformat()
+        if sync_state:
+            db.set_sync_state(sync_state)
+
+    def __send_pipeline_order(self, db: ParserDb, state: RunState, pipeline_order: tuple) -> list:
+        state.get_writer("delivery").add(pipeline_order)
+        self.__renew_lock(db, state)
+        return []
+
+    def __store_orders(self, db: ParserDb, state: RunState, rows: list) -> bool:
+        state.get_writer("customer").flush()
+        if not db.add_orders(rows):
+            return False
+
+        orders = [{
+            "url": url,
+            "order_type": order_type,
+            "order_id": order_id,
+            "order_data": order_data,
+            "order_detail": order_detail,
+            "order_lots": order_lots,
+            "customer_id": customer_id
+        } for url, order_type, order_id, order_data, order_detail, customer_id, was_send, detail_hash, order_lots
+            in rows if not was_send]
+        state.add_stored_orders(orders)
+        return True
+
+    def __store_refreshed_orders(self, db: ParserDb, state: RunState, rows: list) -> bool:
+        if not db.update_orders(rows):
+            return False
+
+        orders = [{
+            "url": self.__get_item_url(order_type, order_id),
+            "order_type": order_type,
+            "order_id": order_id,
+            "order_data": order_data,
+            "order_detail": order_detail,
+            "order_lots": order_lots,
+            "customer_id": json.loads(order_data).get("customers")[0].get("id")
+        } for order_data, order_detail, order_lots, detail_hash, order_type, order_id in rows]
+        state.add_stored_orders(orders)
+        return True
+
+    def __track_high_water_mark(self, page: dict) -> dict:
+        for item in page.get("items", []):
+            timestamp = self.__get_item_timestamp(item)
+            if timestamp and (not self.__listing_high_water_mark or timestamp > self.__listing_high_water_mark):
+                self.__listing_high_water_mark = timestamp
+        return page
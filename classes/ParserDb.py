@@ -1,59 +1,169 @@
 import datetime
+import functools
+import hashlib
+import itertools
+import json
+import threading
+import time
 
 
 from classes.BaseDb import BaseDb
+from classes.BlobCodec import BlobCodec
+from classes.Migration import Migration
+from classes.Migrator import Migrator
 
 
 class ParserDb(BaseDb):
+    __blob_columns = {
+        "order_data": ("orders", "order_data"),
+        "order_detail": ("orders", "order_detail"),
+        "order_lots": ("orders", "order_lots"),
+        "payload": ("orders", "payload"),
+        "customer_data": ("customers", "customer_data")
+    }
+    __customer_columns = ("created_at", "url", "customer_id", "customer_data")
+    __order_columns = ("created_at", "url", "order_type", "order_id", "order_data", "order_detail", "customer_id",
+                       "was_send", "detail_hash", "order_lots", "payload", "payload_version")
+    __order_blob_columns = ("order_type", "order_id", "order_data", "order_detail", "order_lots", "customer_id")
+    __order_payload_columns = ("url", "order_type", "order_id", "payload", "payload_version")
+
+    def __init__(self, db_name: str, compress_blobs: bool = False, dictionary_samples: int = 200, **kwargs):
+        super().__init__(db_name, **kwargs)
+        self._compress_blobs = compress_blobs
+        self._dictionary_samples = dictionary_samples
+        self.__blob_codec = None
+        self.__blob_samples = {}
+        self.__blob_samples_lock = threading.Lock()
+        self.__backfill_rowids = {}
+
+    def acquire_lock(self, name: str, owner: str, pid: int, lease_seconds: float) -> bool:
+        now = time.time()
+        query = "INSERT INTO locks(name, owner, pid, lease_until) VALUES (?, ?, ?, ?) " \
+                "ON CONFLICT(name) DO UPDATE SET " \
+                "owner=excluded.owner, pid=excluded.pid, lease_until=excluded.lease_until " \
+                "WHERE locks.owner=excluded.owner OR locks.lease_until < ?"
+        self.write_data_to_db(query, [(name, owner, pid, now + lease_seconds, now)])
+        return self.get_lock(name).get("owner") == owner
+
     def add_customer(self, url: str, customer_id: str, customer_data: str) -> bool:
+        return self.add_customers([(url, customer_id, customer_data)])
+
+    def add_customers(self, values: list) -> bool:
         query = "INSERT INTO " \
                 "customers(url, customer_id, customer_data) " \
-                "VALUES (?, ?, ?)"
-        return self.write_data_to_db(query, [(url, customer_id, customer_data)])
+                "VALUES (?, ?, ?) " \
+                "ON CONFLICT(customer_id) DO UPDATE SET " \
+                "url=excluded.url, customer_data=excluded.customer_data"
+        if self._compress_blobs:
+            values = [(url, customer_id, self.encode_blob("customer_data", customer_data))
+                      for url, customer_id, customer_data in values]
+        return self.write_data_to_db(query, values)
 
     def add_order(self, url: str, order_type: str, order_id: str,
                   order_data: str, order_detail: str, customer_id: str,
-                  was_send: int = 0) -> bool:
+                  was_send: int = 0, detail_hash: str = "", order_lots: str = None) -> bool:
+        values = [(url, order_type, order_id, order_data, order_detail, customer_id, was_send, detail_hash,
+                   order_lots)]
+        return self.add_orders(values)
+
+    def add_orders(self, values: list) -> bool:
         query = "INSERT INTO " \
                 "orders(url, order_type, order_id, order_data, order_detail, " \
-                "customer_id, was_send) " \
-                "VALUES (?, ?, ?, ?, ?, ?, ?)"
-        values = [(url, order_type, order_id, order_data, order_detail, customer_id, was_send)]
+                "customer_id, was_send, detail_hash, order_lots) " \
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) " \
+                "ON CONFLICT(order_type, order_id) DO NOTHING"
+        if self._compress_blobs:
+            values = [(url, order_type, order_id,
+                       self.encode_blob("order_data", order_data),
+                       self.encode_blob("order_detail", order_detail),
+                       customer_id, was_send, detail_hash,
+                       self.encode_blob("order_lots", order_lots))
+                      for url, order_type, order_id, order_data, order_detail, customer_id, was_send, detail_hash,
+                      order_lots in values]
         return self.write_data_to_db(query, values)
 
-    def create_table_customers(self):
-        cursor = self.create_connection().cursor()
+    def compress_blobs(self, batch_size: int = 1000) -> int:
+        self.train_blob_dictionaries()
+        blob_codec = self.__get_blob_codec()
+
+        tables = {}
+        for kind, (table, column) in self.__blob_columns.items():
+            if self.__has_column(table, column):
+                tables.setdefault(table, []).append((kind, column))
+
+        processed = 0
+        for table, columns in tables.items():
+            # text values are compressed, blobs written before the current dictionary of their kind are recompressed
+            conditions = []
+            for kind, column in columns:
+                dict_id = blob_codec.get_dictionary_id(kind)
+                conditions.append(f"typeof({column})='text' OR "
+                                  f"(typeof({column})='blob' AND substr({column}, 3, 2) != X'{dict_id:04x}')")
+            query = f"SELECT rowid, {', '.join(column for kind, column in columns)} FROM {table} " \
+                    f"WHERE rowid > ? AND ({' OR '.join(conditions)}) ORDER BY rowid LIMIT ?"
+            assignments = ", ".join(f"{column}=?" for kind, column in columns)
+            last_rowid, count = 0, 0
+            while True:
+                rows = self.get_all_from_db(query, (last_rowid, batch_size))
+                if not rows:
+                    break
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customers (
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                url TEXT DEFAULT "", 
-                customer_id TEXT DEFAULT "", 
-                customer_data TEXT DEFAULT ""
+                values = [tuple(self.encode_blob(kind, self.decode_blob(value))
+                                for (kind, column), value in zip(columns, row[1:])) + (row[0],)
+                          for row in rows]
+                self.write_data_to_db(f"UPDATE {table} SET {assignments} WHERE rowid=?", values)
+                last_rowid = rows[-1][0]
+                count += len(rows)
+                print(f"[MIGRATION] Сжатие {table}: обработано {count} строк")
+            processed += count
+        return processed
+
+    def create_run(self, pid: int, high_water_mark: str = "") -> dict:
+        query = "INSERT INTO runs(pid, high_water_mark) VALUES (?, ?)"
+        self.write_data_to_db(query, [(pid, high_water_mark)])
+        rows = self.get_all_from_db("SELECT * FROM runs ORDER BY run_id DESC LIMIT 1")
+        return self.formatted_run(rows[0])
+
+    def create_table_locks(self):
+        # the lease is taken before pending migrations are applied, so its table is created outside of them
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT DEFAULT "",
+                pid INTEGER DEFAULT 0,
+                lease_until REAL DEFAULT 0
             )""")
 
-    def create_table_orders(self):
-        cursor = self.create_connection().cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                url TEXT DEFAULT "", 
-                order_type TEXT DEFAULT "", 
-                order_id TEXT DEFAULT "", 
-                order_data TEXT DEFAULT "", 
-                order_detail TEXT DEFAULT "", 
-                customer_id TEXT DEFAULT "", 
-                was_send BOOLEAN DEFAULT 0
-            )
-        """)
+    def decode_blob(self, value):
+        blob_codec = self.__get_blob_codec()
+        if not blob_codec.can_decode(value):
+            # the dictionary was trained by another connection after ours was loaded
+            self.__blob_codec = None
+            blob_codec = self.__get_blob_codec()
+        return blob_codec.decode(value)
+
+    def encode_blob(self, kind: str, value):
+        blob_codec = self.__get_blob_codec()
+        if isinstance(value, str) and not blob_codec.has_dictionary(kind):
+            self.__add_blob_sample(kind, value)
+            blob_codec = self.__get_blob_codec()
+        return blob_codec.encode(kind, value)
+
+    def formatted_columns(self, columns: tuple, row: list) -> dict:
+        values = dict(zip(columns, row))
+        for column, value in values.items():
+            if column == "created_at":
+                values[column] = self.get_created_at_date(value)
+            elif column in self.__blob_columns:
+                values[column] = self.decode_blob(value)
+        return values
 
     def formatted_customer(self, customer_row: list) -> dict:
         return {
             "created_at": self.get_created_at_date(customer_row[0]),
             "url": customer_row[1],
             "customer_id": customer_row[2],
-            "customer_data": customer_row[3],
+            "customer_data": self.decode_blob(customer_row[3]),
         }
 
     def formatted_order(self, order_row: list) -> dict:
@@ -62,54 +172,375 @@ class ParserDb(BaseDb):
             "url": order_row[1],
             "order_type": order_row[2],
             "order_id": order_row[3],
-            "order_data": order_row[4],
-            "order_detail": order_row[5],
+            "order_data": self.decode_blob(order_row[4]),
+            "order_detail": self.decode_blob(order_row[5]),
             "customer_id": order_row[6],
-            "was_send": order_row[7]
+            "was_send": order_row[7],
+            "detail_hash": order_row[8] if len(order_row) > 8 else "",
+            "order_lots": self.decode_blob(order_row[9]) if len(order_row) > 9 else None,
+            "payload": self.decode_blob(order_row[10]) if len(order_row) > 10 else None,
+            "payload_version": order_row[11] if len(order_row) > 11 else 0
         }
 
-    def get_all_customers(self) -> dict:
+    def formatted_run(self, run_row: list) -> dict:
+        return {
+            "run_id": run_row[0],
+            "started_at": self.get_created_at_date(run_row[1]),
+            "updated_at": self.get_created_at_date(run_row[2]),
+            "pid": run_row[3],
+            "status": run_row[4],
+            "stage": run_row[5],
+            "high_water_mark": run_row[6],
+            "listing_skip": run_row[7],
+            "count_all_item": run_row[8],
+            "processed_items": run_row[9]
+        }
+
+    def get_all_customers(self, limit: int = None) -> dict:
         query = "SELECT * FROM customers"
-        rows = self.get_all_from_db(query)
+        params = ()
+        if limit:
+            query += " ORDER BY rowid DESC LIMIT ?"
+            params = (limit,)
+        rows = self.get_all_from_db(query, params)
         return {row[2]: self.formatted_customer(row) for row in rows}
 
     def get_all_orders(self) -> dict:
-        query = "SELECT * FROM orders"
-        rows = self.get_all_from_db(query)
-        return {row[3]: self.formatted_order(row) for row in rows}
+        return {order.get("order_id"): order for order in self.iter_orders()}
 
     def get_all_order_ids(self) -> list:
-        query = "SELECT order_id FROM orders"
-        rows = self.get_all_from_db(query)
-        return [row[0] for row in rows]
+        return [order.get("order_id") for order in self.iter_orders(("order_id",))]
+
+    def get_all_order_keys(self) -> set:
+        return {(order.get("order_type"), order.get("order_id"))
+                for order in self.iter_orders(("order_type", "order_id"))}
+
+    def get_all_order_hashes(self) -> dict:
+        return {(order.get("order_type"), order.get("order_id")): order.get("detail_hash")
+                for order in self.iter_orders(("order_type", "order_id", "detail_hash"))}
 
     def get_customer_by_customer_id(self, customer_id: str) -> dict:
-        query = f"SELECT * FROM customers WHERE customer_id={customer_id}"
-        rows = self.get_all_from_db(query)
+        query = "SELECT * FROM customers WHERE customer_id=?"
+        rows = self.get_all_from_db(query, (str(customer_id),))
         customers = [self.formatted_customer(row) for row in rows]
         if customers:
             return customers.pop()
         else:
             return {}
 
+    def get_customers_by_customer_ids(self, customer_ids: list) -> dict:
+        customer_ids = [str(customer_id) for customer_id in set(customer_ids)]
+        if not customer_ids:
+            return {}
+        query = f"SELECT * FROM customers WHERE customer_id IN ({', '.join('?' * len(customer_ids))})"
+        rows = self.get_all_from_db(query, tuple(customer_ids))
+        return {row[2]: self.formatted_customer(row) for row in rows}
+
+    def get_lock(self, name: str) -> dict:
+        rows = self.get_all_from_db("SELECT name, owner, pid, lease_until FROM locks WHERE name=?", (name,))
+        if not rows:
+            return {}
+        return {"name": rows[0][0], "owner": rows[0][1], "pid": rows[0][2], "lease_until": rows[0][3]}
+
+    def get_migrations(self) -> list:
+        migrations = [
+            Migration(1, "create_tables", [
+                """
+                CREATE TABLE IF NOT EXISTS orders (
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    url TEXT DEFAULT "", 
+                    order_type TEXT DEFAULT "", 
+                    order_id TEXT DEFAULT "", 
+                    order_data TEXT DEFAULT "", 
+                    order_detail TEXT DEFAULT "", 
+                    customer_id TEXT DEFAULT "", 
+                    was_send BOOLEAN DEFAULT 0
+                )""",
+                """
+                CREATE TABLE IF NOT EXISTS customers (
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    url TEXT DEFAULT "", 
+                    customer_id TEXT DEFAULT "", 
+                    customer_data TEXT DEFAULT ""
+                )""",
+            ]),
+            Migration(2, "unique_keys", [
+                """
+                DELETE FROM customers WHERE rowid NOT IN (
+                    SELECT MAX(rowid) FROM customers GROUP BY customer_id
+                )""",
+                "CREATE UNIQUE INDEX IF NOT EXISTS customers_customer_id ON customers(customer_id)",
+                """
+                DELETE FROM orders WHERE rowid NOT IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY order_type, order_id ORDER BY was_send DESC, rowid
+                        ) AS row_number
+                        FROM orders
+                    ) WHERE row_number = 1
+                )""",
+                "CREATE UNIQUE INDEX IF NOT EXISTS orders_order_key ON orders(order_id, order_type)",
+                "CREATE INDEX IF NOT EXISTS orders_unsent ON orders(created_at) WHERE was_send = 0",
+            ]),
+            Migration(3, "blob_dictionaries", [
+                """
+                CREATE TABLE IF NOT EXISTS blob_dictionaries (
+                    dict_id INTEGER PRIMARY KEY,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    kind TEXT DEFAULT "",
+                    data BLOB
+                )""",
+            ]),
+        ]
+        # version 4 depended on the compress_blobs flag, "migrate.py --compress-blobs" compresses blobs instead
+        migrations.append(Migration(5, "order_detail_hash", [
+            "ALTER TABLE orders ADD COLUMN detail_hash TEXT DEFAULT \"\"",
+        ], backfill=self.__hash_order_details))
+        migrations.append(Migration(6, "sync_state", [
+            """
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT DEFAULT "",
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )""",
+        ]))
+        migrations.append(Migration(7, "runs_and_locks", [
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                pid INTEGER DEFAULT 0,
+                status TEXT DEFAULT "running",
+                stage TEXT DEFAULT "listing",
+                high_water_mark TEXT DEFAULT "",
+                listing_skip INTEGER DEFAULT 0,
+                count_all_item INTEGER DEFAULT 0,
+                processed_items INTEGER DEFAULT 0
+            )""",
+            "CREATE INDEX IF NOT EXISTS runs_status ON runs(status)",
+            """
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT DEFAULT "",
+                pid INTEGER DEFAULT 0,
+                lease_until REAL DEFAULT 0
+            )""",
+        ]))
+        migrations.append(Migration(8, "order_lots", [
+            "ALTER TABLE orders ADD COLUMN order_lots TEXT DEFAULT NULL",
+        ]))
+        migrations.append(Migration(9, "order_payloads", [
+            "ALTER TABLE orders ADD COLUMN payload TEXT DEFAULT NULL",
+            "ALTER TABLE orders ADD COLUMN payload_version INTEGER DEFAULT 0",
+        ]))
+        return migrations
+
+    def get_order_blobs(self, order_keys: list) -> dict:
+        order_keys = {(order_type, str(order_id)) for order_type, order_id in order_keys}
+        if not order_keys:
+            return {}
+        condition = f"(order_type, order_id) IN (VALUES {', '.join(['(?, ?)'] * len(order_keys))})"
+        orders = self.__iter_rows("orders", self.__order_columns, self.formatted_order, self.__order_blob_columns,
+                                  condition, tuple(itertools.chain.from_iterable(order_keys)), len(order_keys))
+        return {(order.get("order_type"), order.get("order_id")): order for order in orders}
+
     def get_order_by_order_id(self, order_id: str) -> dict:
-        query = f"SELECT * FROM orders WHERE order_id={order_id}"
-        rows = self.get_all_from_db(query)
+        query = "SELECT * FROM orders WHERE order_id=?"
+        rows = self.get_all_from_db(query, (str(order_id),))
         orders = [self.formatted_order(row) for row in rows]
         if orders:
             return orders.pop()
         else:
             return {}
 
-    def get_unsent_orders(self) -> list:
-        query = "SELECT * FROM orders WHERE was_send = 0"
+    def get_unfinished_run(self) -> dict:
+        query = "SELECT * FROM runs WHERE status='running' ORDER BY run_id DESC LIMIT 1"
         rows = self.get_all_from_db(query)
-        return [self.formatted_order(row) for row in rows]
+        return self.formatted_run(rows[0]) if rows else {}
+
+    def get_unsent_order_count(self) -> int:
+        return self.get_all_from_db("SELECT COUNT(*) FROM orders WHERE was_send = 0")[0][0]
+
+    def get_unsent_orders(self, first_rowid: int = None, last_rowid: int = None) -> list:
+        return list(self.iter_unsent_orders(first_rowid=first_rowid, last_rowid=last_rowid))
+
+    def get_unsent_rowid_ranges(self, chunk_size: int) -> list:
+        query = "SELECT MIN(rowid), MAX(rowid) FROM (" \
+                "SELECT rowid, (ROW_NUMBER() OVER (ORDER BY rowid) - 1) / ? AS chunk " \
+                "FROM orders WHERE was_send = 0" \
+                ") GROUP BY chunk ORDER BY chunk"
+        return self.get_all_from_db(query, (chunk_size,))
+
+    def get_sync_state(self, key: str) -> str:
+        rows = self.get_all_from_db("SELECT value FROM sync_state WHERE key=?", (key,))
+        return rows[0][0] if rows else ""
+
+    def iter_customers(self, columns: tuple = None, batch_size: int = 500):
+        return self.__iter_rows("customers", self.__customer_columns, self.formatted_customer,
+                                columns, "", (), batch_size)
+
+    def iter_orders(self, columns: tuple = None, batch_size: int = 500):
+        return self.__iter_rows("orders", self.__order_columns, self.formatted_order, columns, "", (), batch_size)
+
+    def iter_unsent_orders(self, columns: tuple = None, batch_size: int = 500,
+                           first_rowid: int = None, last_rowid: int = None):
+        condition, params = "was_send = 0", ()
+        if first_rowid is not None and last_rowid is not None:
+            condition += " AND rowid BETWEEN ? AND ?"
+            params = (first_rowid, last_rowid)
+        return self.__iter_rows("orders", self.__order_columns, self.formatted_order,
+                                columns, condition, params, batch_size)
+
+    def iter_unsent_payloads(self, batch_size: int = 500, first_rowid: int = None, last_rowid: int = None):
+        return self.iter_unsent_orders(self.__order_payload_columns, batch_size, first_rowid, last_rowid)
+
+    def mark_sent_many(self, order_keys: list) -> bool:
+        query = "UPDATE orders SET was_send=1, order_data=NULL, order_detail=NULL, order_lots=NULL, payload=NULL " \
+                "WHERE order_type=? AND order_id=?"
+        return self.write_data_to_db(query, [(order_type, str(order_id)) for order_type, order_id in order_keys])
+
+    def migrate(self, dry_run: bool = False) -> list:
+        migrations = Migrator(self, self.get_migrations(), dry_run=dry_run).migrate()
+        if self._compress_blobs and not dry_run:
+            self.train_blob_dictionaries()
+        return migrations
+
+    def release_lock(self, name: str, owner: str) -> bool:
+        return self.write_data_to_db("DELETE FROM locks WHERE name=? AND owner=?", [(name, owner)])
+
+    def set_sync_state(self, sync_state: dict) -> bool:
+        query = "INSERT INTO sync_state(key, value) VALUES (?, ?) " \
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=CURRENT_TIMESTAMP"
+        return self.write_data_to_db(query, list(sync_state.items()))
+
+    def train_blob_dictionaries(self, sample_size: int = 200, min_samples: int = 20):
+        blob_codec = self.__get_blob_codec()
+        for kind, (table, column) in self.__blob_columns.items():
+            if blob_codec.has_dictionary(kind) or not self.__has_column(table, column):
+                continue
+
+            # rows written before a dictionary existed are compressed without one, so samples are decoded first
+            query = f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY rowid DESC LIMIT ?"
+            samples = [self.decode_blob(row[0]) for row in self.get_all_from_db(query, (sample_size,))]
+            samples = [sample for sample in samples if sample]
+            if len(samples) < min_samples:
+                continue
+            self.__add_blob_dictionary(kind, samples)
+
+    def update_order_hashes(self, values: list) -> bool:
+        query = "UPDATE orders SET detail_hash=? WHERE order_type=? AND order_id=?"
+        return self.write_data_to_db(query, values)
+
+    def update_order_lots(self, values: list) -> bool:
+        query = "UPDATE orders SET order_lots=? WHERE order_type=? AND order_id=?"
+        if self._compress_blobs:
+            values = [(self.encode_blob("order_lots", order_lots), order_type, order_id)
+                      for order_lots, order_type, order_id in values]
+        return self.write_data_to_db(query, values)
+
+    def update_order_payloads(self, values: list) -> bool:
+        query = "UPDATE orders SET payload=?, payload_version=? WHERE order_type=? AND order_id=? AND was_send=0"
+        if self._compress_blobs:
+            values = [(self.encode_blob("payload", payload), payload_version, order_type, order_id)
+                      for payload, payload_version, order_type, order_id in values]
+        return self.write_data_to_db(query, values)
+
+    def update_orders(self, values: list) -> bool:
+        query = "UPDATE orders SET order_data=?, order_detail=?, order_lots=?, detail_hash=?, " \
+                "payload=NULL, was_send=0 " \
+                "WHERE order_type=? AND order_id=?"
+        if self._compress_blobs:
+            values = [(self.encode_blob("order_data", order_data),
+                       self.encode_blob("order_detail", order_detail),
+                       self.encode_blob("order_lots", order_lots),
+                       detail_hash, order_type, order_id)
+                      for order_data, order_detail, order_lots, detail_hash, order_type, order_id in values]
+        return self.write_data_to_db(query, values)
+
+    def update_run(self, run_id: int, values: dict) -> bool:
+        assignments = ", ".join(f"{column}=?" for column in values)
+        query = f"UPDATE runs SET {assignments}, updated_at=CURRENT_TIMESTAMP WHERE run_id=?"
+        return self.write_data_to_db(query, [tuple(values.values()) + (run_id,)])
 
     def update_send_on_success(self, order_id: str) -> bool:
-        query = "UPDATE orders SET was_send=1, order_data=NULL, order_detail=NULL WHERE order_id=?"
-        return self.write_data_to_db(query, [(order_id,)])
+        query = "UPDATE orders SET was_send=1, order_data=NULL, order_detail=NULL, order_lots=NULL, payload=NULL " \
+                "WHERE order_id=?"
+        return self.write_data_to_db(query, [(str(order_id),)])
 
     @staticmethod
     def get_created_at_date(created_at: str, date_format: str = "%Y-%m-%d %H:%M:%S") -> datetime:
         return datetime.datetime.strptime(created_at, date_format)
+
+    @staticmethod
+    def get_detail_hash(order_data: dict, order_detail: dict) -> str:
+        content = {
+            "endDate": order_data.get("endDate"),
+            "detail": order_detail
+        }
+        normalized = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def __add_blob_dictionary(self, kind: str, samples: list):
+        query = "INSERT INTO blob_dictionaries(kind, data) VALUES (?, ?)"
+        self.write_data_to_db(query, [(kind, BlobCodec.train_dictionary(samples))])
+        self.__blob_codec = None
+
+    def __add_blob_sample(self, kind: str, value: str):
+        with self.__blob_samples_lock:
+            samples = self.__blob_samples.setdefault(kind, [])
+            if value:
+                samples.append(value)
+            if len(samples) < self._dictionary_samples:
+                return
+            del self.__blob_samples[kind]
+            self.__add_blob_dictionary(kind, samples)
+
+    def __hash_order_details(self, db: BaseDb, batch_size: int) -> int:
+        last_rowid = self.__backfill_rowids.get("detail_hash", 0)
+        query = "SELECT rowid, order_data, order_detail FROM orders " \
+                "WHERE rowid > ? AND detail_hash = '' AND order_detail IS NOT NULL ORDER BY rowid LIMIT ?"
+        rows = self.get_all_from_db(query, (last_rowid, batch_size))
+        if not rows:
+            return 0
+
+        values = []
+        for rowid, order_data, order_detail in rows:
+            try:
+                detail_hash = self.get_detail_hash(json.loads(self.decode_blob(order_data)),
+                                                   json.loads(self.decode_blob(order_detail)))
+            except ValueError:
+                continue
+            values.append((detail_hash, rowid))
+        self.write_data_to_db("UPDATE orders SET detail_hash=? WHERE rowid=?", values)
+        self.__backfill_rowids["detail_hash"] = rows[-1][0]
+        return len(rows)
+
+    def __get_blob_codec(self) -> BlobCodec:
+        if self.__blob_codec is None:
+            blob_codec = BlobCodec()
+            query = "SELECT name FROM sqlite_master WHERE type='table' AND name='blob_dictionaries'"
+            if self.get_all_from_db(query):
+                for dict_id, kind, data in self.get_all_from_db("SELECT dict_id, kind, data FROM blob_dictionaries"):
+                    blob_codec.add_dictionary(dict_id, kind, data)
+            self.__blob_codec = blob_codec
+        return self.__blob_codec
+
+    def __has_column(self, table: str, column: str) -> bool:
+        return any(row[1] == column for row in self.get_all_from_db(f"PRAGMA table_info({table})"))
+
+    def __iter_rows(self, table: str, table_columns: tuple, format_row, columns: tuple,
+                    condition: str, params: tuple, batch_size: int):
+        select = "*"
+        if columns:
+            unknown_columns = [column for column in columns if column not in table_columns]
+            if unknown_columns:
+                raise ValueError(f"Неизвестные столбцы таблицы {table}: {', '.join(unknown_columns)}")
+            select = ", ".join(columns)
+            format_row = functools.partial(self.formatted_columns, columns)
+
+        query = f"SELECT {select} FROM {table}"
+        if condition:
+            query += f" WHERE {condition}"
+        for row in self.iter_from_db(f"{query} ORDER BY rowid", params, batch_size):
+            yield format_row(row)
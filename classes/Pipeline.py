@@ -0,0 +1,89 @@
+import queue
+import threading
+from typing import Callable, Iterable
+
+
+class Pipeline:
+    __end = object()
+
+    def __init__(self, queue_size: int = 100, idle_interval: float = 1):
+        self._queue_size = queue_size
+        self._idle_interval = idle_interval
+        self.__stages = []
+        self.__errors = []
+        self.__lock = threading.Lock()
+
+    def add_stage(self, name: str, handler: Callable[[object], Iterable],
+                  workers: int = 1, on_finish: Callable[[], Iterable] = None,
+                  on_idle: Callable[[], Iterable] = None):
+        self.__stages.append({
+            "name": name,
+            "handler": handler,
+            "workers": max(1, workers),
+            "on_finish": on_finish,
+            "on_idle": on_idle
+        })
+        return self
+
+    def get_errors(self) -> list:
+        return self.__errors
+
+    def run(self, source: Iterable):
+        queues = [queue.Queue(maxsize=self._queue_size) for _ in self.__stages]
+        threads = []
+        for index, stage in enumerate(self.__stages):
+            next_stage = self.__stages[index + 1] if index + 1 < len(self.__stages) else None
+            output_queue = queues[index + 1] if next_stage else None
+            next_workers = next_stage.get("workers") if next_stage else 0
+            workers_left = [stage.get("workers")]
+            for number in range(stage.get("workers")):
+                thread = threading.Thread(
+                    target=self.__work,
+                    args=(stage, queues[index], output_queue, next_workers, workers_left),
+                    name=f"{stage.get('name')}-{number}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                queues[0].put(item)
+        finally:
+            for _ in range(self.__stages[0].get("workers")):
+                queues[0].put(self.__end)
+            for thread in threads:
+                thread.join()
+
+    def __call(self, stage: dict, output_queue: queue.Queue, handler: Callable, *args):
+        try:
+            results = handler(*args)
+            for result in results or []:
+                if output_queue is not None:
+                    output_queue.put(result)
+        except Exception as err:
+            with self.__lock:
+                self.__errors.append((stage.get("name"), args[0] if args else None, err))
+
+    def __work(self, stage: dict, input_queue: queue.Queue, output_queue: queue.Queue,
+               next_workers: int, workers_left: list):
+        while True:
+            try:
+                item = input_queue.get(timeout=self._idle_interval if stage.get("on_idle") else None)
+            except queue.Empty:
+                self.__call(stage, output_queue, stage.get("on_idle"))
+                continue
+            if item is self.__end:
+                break
+            self.__call(stage, output_queue, stage.get("handler"), item)
+
+        with self.__lock:
+            workers_left[0] -= 1
+            is_last_worker = workers_left[0] == 0
+        if not is_last_worker:
+            return
+
+        if stage.get("on_finish"):
+            self.__call(stage, output_queue, stage.get("on_finish"))
+        for _ in range(next_workers):
+            output_queue.put(self.__end)
@@ -0,0 +1,31 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import EmptyPoolError
+
+
+class PoolAdapter(HTTPAdapter):
+    def __init__(self, pool_timeout: float = None, **kwargs):
+        self._pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self.__with_pool_timeout(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request, **kwargs):
+        try:
+            return super().send(request, **kwargs)
+        except EmptyPoolError as err:
+            raise requests.exceptions.ConnectionError(err, request=request)
+
+    def __with_pool_timeout(self, pool_class):
+        pool_timeout = self._pool_timeout
+
+        class TimeoutConnectionPool(pool_class):
+            def _get_conn(self, timeout: float = None):
+                return super()._get_conn(pool_timeout if timeout is None else timeout)
+
+        return TimeoutConnectionPool
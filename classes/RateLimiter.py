@@ -0,0 +1,87 @@
+import datetime
+import email.utils
+import threading
+import time
+import urllib.parse
+
+
+class RateLimiter:
+    __throttle_status_codes = (429, 503)
+
+    def __init__(self, host_limits: dict = None,
+                 default_rate: float = 2,
+                 default_burst: int = 4,
+                 min_rate: float = 0.2):
+        self._host_limits = host_limits if host_limits else {}
+        self._default_rate = default_rate
+        self._default_burst = default_burst
+        self._min_rate = min_rate
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+
+    def on_response(self, url: str, status_code: int, retry_after: str = None):
+        host = self.get_host(url)
+        now = time.monotonic()
+        with self.__lock:
+            bucket = self.__get_bucket(host, now)
+            if status_code in self.__throttle_status_codes:
+                bucket["rate"] = max(self._min_rate, bucket["rate"] / 2)
+                bucket["tokens"] = min(bucket["tokens"], 0)
+                delay = self.parse_retry_after(retry_after)
+                if delay:
+                    bucket["blocked_until"] = max(bucket["blocked_until"], now + delay)
+                    # tokens refill only after the block, requests reserved during it queue up behind it
+                    bucket["updated_at"] = max(bucket["updated_at"], bucket["blocked_until"])
+            elif bucket["rate"] < bucket["max_rate"]:
+                bucket["rate"] = min(bucket["max_rate"], bucket["rate"] + bucket["max_rate"] / 20)
+
+    def reserve(self, url: str) -> float:
+        host = self.get_host(url)
+        now = time.monotonic()
+        with self.__lock:
+            bucket = self.__get_bucket(host, now)
+            elapsed = max(0.0, now - bucket["updated_at"])
+            bucket["tokens"] = min(bucket["burst"], bucket["tokens"] + elapsed * bucket["rate"])
+            bucket["updated_at"] = max(bucket["updated_at"], now)
+            bucket["tokens"] -= 1
+
+            # the token debt is charged from the end of a Retry-After block, not from now
+            delay = -bucket["tokens"] / bucket["rate"] if bucket["tokens"] < 0 else 0
+            return bucket["updated_at"] - now + delay
+
+    def wait(self, url: str):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        return urllib.parse.urlparse(url).netloc
+
+    @staticmethod
+    def parse_retry_after(retry_after: str) -> float:
+        if not retry_after:
+            return 0
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            retry_date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return 0
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return max(0.0, (retry_date - now).total_seconds())
+
+    def __get_bucket(self, host: str, now: float) -> dict:
+        if host not in self.__buckets:
+            rate, burst = self._host_limits.get(host, (self._default_rate, self._default_burst))
+            self.__buckets[host] = {
+                "rate": rate,
+                "max_rate": rate,
+                "burst": burst,
+                "tokens": burst,
+                "updated_at": now,
+                "blocked_until": 0.0
+            }
+        return self.__buckets[host]
@@ -0,0 +1,15 @@
+import sys
+
+from classes.BaseSender import BaseSender
+
+
+class ReportSender(BaseSender):
+    def __init__(self, path: str = "/home/manage_report"):
+        self._path = path
+        if path not in sys.path:
+            sys.path.append(path)
+        from Send_report.Utils import send_to_api
+        self.__send_to_api = send_to_api
+
+    def send(self, data: dict):
+        return self.__send_to_api(data)
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from classes.BaseDb import BaseDb
+
+
+class ResponseCache(BaseDb):
+    def __init__(self, db_name: str,
+                 ttls: dict = None,
+                 max_size: int = 256 * 1024 * 1024):
+        super().__init__(db_name)
+        self._ttls = ttls if ttls is not None else {
+            "CompanyProfile/GetByCompanyId": 7 * 24 * 60 * 60,
+            "Auction/GetAuctionItemAdditionalInfo": 24 * 60 * 60,
+            "Auction/Get?": 60 * 60,
+            "Need/Get?": 60 * 60,
+            "Tender/GetEntity": 60 * 60
+        }
+        self._max_size = max_size
+        self.__total_size = 0
+        self.__lock = threading.Lock()
+
+    def create_table_responses(self):
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            )""")
+        self.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses(accessed_at)")
+        rows = self.get_all_from_db("SELECT COALESCE(SUM(size), 0) FROM responses")
+        self.__total_size = rows[0][0]
+
+    def formatted_response(self, response_row: list) -> dict:
+        return {
+            "url": response_row[0],
+            "body": response_row[1],
+            "etag": response_row[2],
+            "last_modified": response_row[3],
+            "fetched_at": response_row[4],
+        }
+
+    def get(self, url: str) -> dict:
+        if not self.get_ttl(url):
+            return {}
+
+        query = "SELECT url, body, etag, last_modified, fetched_at FROM responses WHERE url=?"
+        rows = self.get_all_from_db(query, (url,))
+        if not rows:
+            return {}
+
+        self.write_data_to_db("UPDATE responses SET accessed_at=? WHERE url=?", [(time.time(), url)])
+        return self.formatted_response(rows[0])
+
+    def get_revalidation_headers(self, response: dict) -> dict:
+        headers = {}
+        if response.get("etag"):
+            headers["If-None-Match"] = response.get("etag")
+        if response.get("last_modified"):
+            headers["If-Modified-Since"] = response.get("last_modified")
+        return headers
+
+    def get_ttl(self, url: str) -> int:
+        for url_part, ttl in self._ttls.items():
+            if url_part in url:
+                return ttl
+        return 0
+
+    def is_fresh(self, response: dict) -> bool:
+        return response.get("fetched_at", 0) + self.get_ttl(response.get("url", "")) > time.time()
+
+    def put(self, url: str, body: bytes, headers: dict) -> bool:
+        if not self.get_ttl(url):
+            return False
+
+        now = time.time()
+        old_rows = self.get_all_from_db("SELECT size FROM responses WHERE url=?", (url,))
+        query = "INSERT OR REPLACE INTO " \
+                "responses(url, body, etag, last_modified, fetched_at, accessed_at, size) " \
+                "VALUES (?, ?, ?, ?, ?, ?, ?)"
+        values = [(url, body, headers.get("ETag"), headers.get("Last-Modified"), now, now, len(body))]
+        if not self.write_data_to_db(query, values):
+            return False
+
+        with self.__lock:
+            self.__total_size += len(body) - (old_rows[0][0] if old_rows else 0)
+            if self.__total_size > self._max_size:
+                self.__evict()
+        return True
+
+    def touch(self, url: str) -> bool:
+        now = time.time()
+        return self.write_data_to_db("UPDATE responses SET fetched_at=?, accessed_at=? WHERE url=?",
+                                     [(now, now, url)])
+
+    def __evict(self):
+        excess = self.__total_size - self._max_size * 0.9
+        urls, freed = [], 0
+        for url, size in self.get_all_from_db("SELECT url, size FROM responses ORDER BY accessed_at"):
+            if freed >= excess:
+                break
+            urls.append((url,))
+            freed += size
+
+        if self.write_data_to_db("DELETE FROM responses WHERE url=?", urls):
+            self.__total_size -= freed
@@ -0,0 +1,50 @@
+import random
+import threading
+
+import requests
+
+
+class RetryPolicy:
+    __transient_status_codes = (408, 425, 429, 500, 502, 503, 504)
+
+    def __init__(self, max_attempts: int = 4,
+                 base_delay: float = 1,
+                 max_delay: float = 30,
+                 retry_budget: int = 200):
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._retry_budget = retry_budget
+        self.__retries_left = retry_budget
+        self.__lock = threading.Lock()
+
+    def get_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** (attempt - 1)))
+
+    def get_max_attempts(self) -> int:
+        return self._max_attempts
+
+    def get_retries_left(self) -> int:
+        return self.__retries_left
+
+    def is_transient(self, err: requests.exceptions.RequestException) -> bool:
+        if isinstance(err, (requests.exceptions.ConnectionError,
+                            requests.exceptions.Timeout,
+                            requests.exceptions.ChunkedEncodingError)):
+            return True
+        elif isinstance(err, requests.exceptions.HTTPError) and err.response is not None:
+            return err.response.status_code in self.__transient_status_codes
+        return False
+
+    def reset_budget(self):
+        with self.__lock:
+            self.__retries_left = self._retry_budget
+
+    def should_retry(self, err: requests.exceptions.RequestException, attempt: int) -> bool:
+        if attempt >= self._max_attempts or not self.is_transient(err):
+            return False
+        with self.__lock:
+            if self.__retries_left <= 0:
+                return False
+            self.__retries_left -= 1
+            return True
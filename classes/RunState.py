@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+from classes.BatchWriter import BatchWriter
+
+
+class RunState:
+    def __init__(self, run: dict, known_order_keys):
+        self._run = run
+        self._known_order_keys = known_order_keys
+        self.__count_all_item = run.get("count_all_item")
+        self.__count_send = 0
+        self.__count_send_error = 0
+        self.__is_listing_loaded = False
+        self.__pages = OrderedDict()
+        self.__stored_orders = []
+        self.__lock_renewed_at = time.monotonic()
+        self.__writers = {}
+        self.__lock = threading.RLock()
+        self.__stored_orders_lock = threading.Lock()
+
+    def add_stored_orders(self, orders: list):
+        with self.__stored_orders_lock:
+            self.__stored_orders.extend(orders)
+
+    def complete_page_item(self, skip: int) -> tuple:
+        with self.__lock:
+            self.__pages[skip]["items_left"] -= 1
+            return self.__pop_checkpoint()
+
+    def flush_writers(self):
+        for name in ("customer", "order", "refresh", "hash"):
+            self.__writers[name].flush()
+
+    def get_count_all_item(self) -> int:
+        return self.__count_all_item
+
+    def get_count_send(self) -> int:
+        return self.__count_send
+
+    def get_count_send_error(self) -> int:
+        return self.__count_send_error
+
+    def get_known_order_keys(self):
+        return self._known_order_keys
+
+    def get_lock(self) -> threading.RLock:
+        return self.__lock
+
+    def get_run(self) -> dict:
+        return self._run
+
+    def get_writer(self, name: str) -> BatchWriter:
+        return self.__writers[name]
+
+    def increment_count_send(self, value: int = 1):
+        with self.__lock:
+            self.__count_send += value
+
+    def increment_count_send_error(self, value: int = 1):
+        with self.__lock:
+            self.__count_send_error += value
+
+    def is_listing_loaded(self) -> bool:
+        return self.__is_listing_loaded
+
+    def is_lock_renewal_due(self, interval: float) -> bool:
+        with self.__lock:
+            if time.monotonic() - self.__lock_renewed_at < interval:
+                return False
+            self.__lock_renewed_at = time.monotonic()
+            return True
+
+    def pop_stored_orders(self) -> list:
+        with self.__stored_orders_lock:
+            orders, self.__stored_orders = self.__stored_orders, []
+        return orders
+
+    def register_page(self, skip: int, items_count: int, processed_items: int) -> tuple:
+        with self.__lock:
+            self.__pages[skip] = {
+                "items_left": items_count,
+                "processed_items": processed_items
+            }
+            return self.__pop_checkpoint()
+
+    def set_count_all_item(self, count_all_item: int):
+        self.__count_all_item = count_all_item
+
+    def set_listing_loaded(self):
+        self.__is_listing_loaded = True
+
+    def set_writer(self, name: str, writer: BatchWriter):
+        self.__writers[name] = writer
+
+    def __pop_checkpoint(self) -> tuple:
+        checkpoint = None
+        while self.__pages and next(iter(self.__pages.values())).get("items_left") <= 0:
+            checkpoint = self.__pages.popitem(last=False)
+        return checkpoint
@@ -0,0 +1,22 @@
+import argparse
+
+from classes.ParserDb import ParserDb
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Миграции схемы БД zakupkimos.db")
+    arg_parser.add_argument("--db", default="zakupkimos.db")
+    arg_parser.add_argument("--dry-run", action="store_true")
+    arg_parser.add_argument("--compress-blobs", action="store_true")
+    args = arg_parser.parse_args()
+
+    with ParserDb(args.db, compress_blobs=args.compress_blobs) as db:
+        migrations = db.migrate(dry_run=args.dry_run)
+        if not migrations:
+            print("[MIGRATION] Схема БД актуальна")
+
+        if args.compress_blobs and args.dry_run:
+            print("[MIGRATION] (dry run) сжатие текстовых столбцов и пересжатие по текущим словарям")
+        elif args.compress_blobs:
+            count = db.compress_blobs()
+            print(f"[MIGRATION] Сжатие завершено, обработано {count} строк")
@@ -0,0 +1,65 @@
+import json
+import unittest
+
+from classes.JsonStream import JsonStream
+
+
+def split_chunks(text: str, size: int) -> list:
+    data = text.encode("utf-8")
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+class JsonStreamTest(unittest.TestCase):
+    document = {
+        "count": 3,
+        "items": [
+            {"id": 1, "name": "Поставка", "price": 1.5e3, "tags": ["a", "b"], "isActive": True},
+            {"id": 2, "name": "кавычка \" и \\ слеш", "price": -0.25, "tags": [], "isActive": False},
+            {"id": 3, "name": None, "price": 12345678901234567890, "tags": [{"x": 1}], "isActive": None}
+        ],
+        "withCount": True
+    }
+
+    def test_every_chunk_boundary(self):
+        text = json.dumps(self.document, ensure_ascii=False)
+        for size in range(1, len(text.encode("utf-8")) + 1):
+            with self.subTest(size=size):
+                stream = JsonStream(split_chunks(text, size))
+                self.assertEqual(list(stream), self.document.get("items"))
+                self.assertEqual(stream.get_meta(), {"count": 3, "withCount": True})
+
+    def test_numbers_split_inside(self):
+        for chunks in (
+                [b'{"items":[1.', b'5]}'],
+                [b'{"items":[1', b'.5]}'],
+                [b'{"items":[1e', b'3]}'],
+                [b'{"items":[1E+', b'3]}'],
+                [b'{"items":[-', b'12, 3]}'],
+                [b'{"items":[12', b'34]}']):
+            with self.subTest(chunks=chunks):
+                self.assertEqual(list(JsonStream(chunks)), json.loads(b"".join(chunks)).get("items"))
+
+    def test_empty_array(self):
+        stream = JsonStream([b'{"count": 0, "items": []}'])
+        self.assertEqual(list(stream), [])
+        self.assertEqual(stream.get_meta(), {"count": 0})
+        self.assertTrue(stream.has_array())
+
+    def test_error_body_without_array(self):
+        for size in (1, 4, 64):
+            with self.subTest(size=size):
+                stream = JsonStream(split_chunks('{"httpStatusCode": 500, "message": "Ошибка"}', size))
+                self.assertEqual(list(stream), [])
+                self.assertFalse(stream.has_array())
+                self.assertEqual(stream.get_meta(), {"httpStatusCode": 500, "message": "Ошибка"})
+
+    def test_invalid_json(self):
+        for text in ('{"items": [1 2]}', '{"items": [1,, 2]}', '{"items": [1, 2,]}', '{"count": 1 "items": []}',
+                     '{, "items": []}', '{"items": [1, 2]', '{1: 2}', '["items"]'):
+            with self.subTest(text=text):
+                with self.assertRaises(json.JSONDecodeError):
+                    list(JsonStream(split_chunks(text, 3)))
+
+
+if __name__ == "__main__":
+    unittest.main()
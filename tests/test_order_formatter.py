@@ -0,0 +1,176 @@
+import json
+import unittest
+
+from classes.OrderFormatter import OrderFormatter
+from classes.Parser import Parser
+
+
+def format_need_order(order: dict, customer: dict) -> dict:
+    order_data = json.loads(order.get("order_data"))
+    order_detail = json.loads(order.get("order_detail"))
+    company = json.loads(customer.get("customer_data")).get("company")
+    result = {
+        "fz": "ЗМО",
+        "purchaseNumber": order_data.get("number"),
+        "url": order.get("url"),
+        "title": order_data.get("name"),
+        "purchaseType": "Закупка по потребности",
+        "procedureInfo": {
+            "endDate": order_data.get("endDate")
+        },
+        "lots": [{
+            "price": order_detail.get("nmck"),
+            "customerRequirements": [{
+                "kladrPlaces": [{
+                    "deliveryPlace": order_detail.get("deliveryPlace"),
+                }]
+            }],
+        }],
+        "ETP": {
+            "name": "zakupki.mos.ru"
+        },
+        "attachments": [{
+            "docDescription": doc.get("name"),
+            "url": Parser._get_document_url(doc.get("id"))
+        } for doc in order_detail.get("files")],
+        "type": 2
+    }
+    add_customer(result, company)
+
+    contact_name = order_detail.get("contactPerson").split() if order_detail.get("contactPerson") else ["", ""]
+    if len(contact_name) == 1:
+        contact_name.append("")
+    for key, value in (("lastName", contact_name[0]), ("firstName", contact_name[1]),
+                       ("contactEMail", order_detail.get("contactEmail")),
+                       ("contactPhone", order_detail.get("contactPhone"))):
+        if value:
+            result.setdefault("contactPerson", {})[key] = value
+
+    okpd_codes = [{"code": item.get("okpd").get("code")} for item in order_detail.get("items")]
+    if okpd_codes:
+        result.get("lots")[0]["lotItems"] = okpd_codes
+    return result
+
+
+def format_auction_order(order: dict, customer: dict) -> dict:
+    order_data = json.loads(order.get("order_data"))
+    order_detail = json.loads(order.get("order_detail"))
+    company = json.loads(customer.get("customer_data")).get("company")
+    result = {
+        "fz": "ЗМО",
+        "purchaseNumber": order_data.get("number"),
+        "url": order.get("url"),
+        "title": order_data.get("name"),
+        "purchaseType": "Котировочная сессия",
+        "procedureInfo": {
+            "endDate": order_data.get("endDate")
+        },
+        "lots": [{
+            "price": order_detail.get("startCost"),
+            "customerRequirements": [{
+                "kladrPlaces": order_detail.get("deliveries")[0].get("deliveryPlace"),
+                "obesp_i": order_detail.get("contractGuaranteeAmount")
+            }],
+        }],
+        "ETP": {
+            "name": "zakupki.mos.ru"
+        },
+        "attachments": [{
+            "docDescription": doc.get("name"),
+            "url": Parser._get_document_url(doc.get("id"))
+        } for doc in order_detail.get("files")],
+        "type": 2
+    }
+    add_customer(result, company)
+
+    okpd_codes = [{"code": lot.get("okpd").get("code")} for lot in json.loads(order.get("order_lots"))]
+    if okpd_codes:
+        result.get("lots")[0]["lotItems"] = okpd_codes
+    return result
+
+
+def add_customer(result: dict, company: dict):
+    for key in ("factAddress", "inn", "kpp"):
+        if company.get(key):
+            result.setdefault("customer", {})[key] = company.get(key)
+
+
+def create_order(order_type: str, order_id: str, order_data: dict, order_detail: dict, order_lots: list = None):
+    return {
+        "url": f"https://zakupki.mos.ru/{order_type}/{order_id}",
+        "order_type": order_type,
+        "order_id": order_id,
+        "order_data": json.dumps(order_data, ensure_ascii=False),
+        "order_detail": json.dumps(order_detail, ensure_ascii=False),
+        "order_lots": json.dumps(order_lots, ensure_ascii=False) if order_lots is not None else None,
+        "customer_id": "1"
+    }
+
+
+class OrderFormatterTest(unittest.TestCase):
+    customers = [
+        {"customer_id": "1", "customer_data": json.dumps({"company": {
+            "factAddress": "Москва, ул. Тверская, д. 1", "inn": "7701000001", "kpp": "770101001"}})},
+        {"customer_id": "2", "customer_data": json.dumps({"company": {"inn": "7701000002", "kpp": ""}})},
+        {"customer_id": "3", "customer_data": json.dumps({"company": {}})},
+    ]
+    order_data = {"number": "N-1", "name": "Поставка бумаги", "endDate": "2026-10-18T10:00:00"}
+    need_details = [
+        {"nmck": 1500.5, "deliveryPlace": "Москва",
+         "files": [{"name": "ТЗ.docx", "id": 10}, {"name": "Проект", "id": 11}],
+         "contactPerson": "Иванов Иван Иванович", "contactEmail": "mail@mos.ru", "contactPhone": "+7 495 000-00-00",
+         "items": [{"okpd": {"code": "17.12"}}, {"okpd": {"code": "17.23"}}]},
+        {"nmck": None, "deliveryPlace": None, "files": [], "contactPerson": "Петров", "contactEmail": "",
+         "contactPhone": "+7 495 000-00-01", "items": []},
+        {"nmck": 0, "files": [], "contactPerson": None, "items": []},
+    ]
+    auction_detail = {
+        "startCost": 700, "contractGuaranteeAmount": 35, "files": [{"name": "Извещение", "id": 20}],
+        "deliveries": [{"deliveryPlace": [{"code": "7700000000000"}]}], "items": [{"id": 1}, {"id": 2}]
+    }
+    auction_lots = [{"okpd": {"code": "26.20"}}, {"okpd": {"code": "58.29"}}]
+
+    def setUp(self):
+        self.formatter = OrderFormatter(Parser._get_formatter_specs(), Parser._get_order_sources)
+
+    def test_need_orders_match_hand_written_formatter(self):
+        for customer in self.customers:
+            for index, order_detail in enumerate(self.need_details):
+                with self.subTest(customer=customer.get("customer_id"), order=index):
+                    order = create_order("need", str(index), self.order_data, order_detail)
+                    expected = format_need_order(order, customer)
+                    formatted_order, = self.formatter.format_many(
+                        [(order, json.loads(customer.get("customer_data")))])
+                    self.assertEqual(json.dumps(formatted_order, ensure_ascii=False),
+                                     json.dumps(expected, ensure_ascii=False))
+
+    def test_auction_orders_match_hand_written_formatter(self):
+        for customer in self.customers:
+            with self.subTest(customer=customer.get("customer_id")):
+                order = create_order("auction", "1", self.order_data, self.auction_detail, self.auction_lots)
+                expected = format_auction_order(order, customer)
+                formatted_order, = self.formatter.format_many([(order, json.loads(customer.get("customer_data")))])
+                self.assertEqual(json.dumps(formatted_order, ensure_ascii=False),
+                                 json.dumps(expected, ensure_ascii=False))
+
+    def test_format_many_reports_failed_rows(self):
+        customer = json.loads(self.customers[0].get("customer_data"))
+        rows = [
+            (create_order("auction", "1", self.order_data, self.auction_detail), customer),
+            (create_order("need", "2", self.order_data, self.need_details[0]), customer),
+            (create_order("unknown", "3", self.order_data, {}), customer),
+        ]
+        errors = []
+        formatted_orders = self.formatter.format_many(rows, lambda row, err: errors.append((row, err)))
+
+        self.assertEqual(formatted_orders[0], {})
+        self.assertEqual(formatted_orders[1], format_need_order(rows[1][0], self.customers[0]))
+        self.assertEqual(formatted_orders[2], {})
+        self.assertEqual([row for row, err in errors], [rows[0]])
+        self.assertIsInstance(errors[0][1], ValueError)
+        with self.assertRaises(ValueError):
+            self.formatter.format_many(rows[:1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,7 +6,7 @@ if __name__ == "__main__":
         parser_name="zakupki.mos.ru",
         is_sending_orders=False,
         append_base_path=False,
-        is_sleeping=False
+        fetch_workers=8
     )
 
     parser.start()